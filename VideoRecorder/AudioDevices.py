@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Gemeinsame Audio-Geräteerkennung für VideoRecorder.py und AudioRecorder.py.
+
+Sucht zum Standard-Ausgabegerät die passende Loopback-Quelle und merkt sich das Ergebnis,
+so dass weitere Aufnahmen im selben Prozess ohne erneute Geräteliste starten. Der Zugriff
+auf die Geräte läuft über ein austauschbares Backend: "soundcard" für echte Hardware oder
+FakeBackend (Sinuston bzw. Stille im Echtzeittakt) für Tests und Benchmarks ohne Audio-Hardware.
+
+    speaker_name, device = loopback_device()
+    with device.recorder(samplerate=44100, channels=2, blocksize=882) as recorder:
+        data = recorder.record()
+"""
+import importlib
+import math
+import os
+import threading
+import time
+
+# --- KONFIGURATION ---
+# Backend ohne expliziten Aufruf von set_backend(): "soundcard" oder "fake" (überschreibbar per Umgebungsvariable)
+AUDIO_BACKEND = os.environ.get("VIDEORECORDER_AUDIO_BACKEND", "soundcard")
+FAKE_DEVICE_NAME = "Fake Loopback"
+FAKE_TONE_HZ = 440.0 # Tonhöhe des Ersatzgeräts; 0 liefert Stille
+
+
+# --- BACKENDS ---
+
+class SoundcardBackend:
+    """Echte Geräte über soundcard (WASAPI-Loopback unter Windows, Monitor-Quellen unter PulseAudio)."""
+
+    name = "soundcard"
+
+    def __init__(self):
+        # Erst hier importieren, damit Skripte ohne Audio (z.B. MuxQueue.py) soundcard nicht laden
+        self._soundcard = importlib.import_module("soundcard")
+
+    def default_speaker(self):
+        return self._soundcard.default_speaker()
+
+    def all_microphones(self):
+        return self._soundcard.all_microphones(include_loopback=True)
+
+
+class FakeRecorder:
+    """Liefert einen Sinuston im Echtzeittakt, wie ein Loopback-Recorder von soundcard."""
+
+    def __init__(self, samplerate, channels, blocksize, tone_hz=FAKE_TONE_HZ):
+        self.samplerate = samplerate
+        self.channels = channels or 2
+        self.blocksize = blocksize or samplerate // 10
+        self.tone_hz = tone_hz
+        self._position = 0 # Bisher gelieferte Samples
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, numframes=None):
+        import numpy as np
+        numframes = numframes or self.blocksize
+        # Blockieren, bis die Samples in Echtzeit "aufgenommen" worden wären
+        due = self._start + (self._position + numframes) / self.samplerate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t = (np.arange(numframes) + self._position) / self.samplerate
+        self._position += numframes
+        tone = (0.2 * np.sin(2 * math.pi * self.tone_hz * t)).astype(np.float32)
+        return np.repeat(tone[:, None], self.channels, axis=1)
+
+
+class FakeMicrophone:
+    def __init__(self, name, tone_hz=FAKE_TONE_HZ):
+        self.name = name
+        self.id = name
+        self.isloopback = True
+        self.tone_hz = tone_hz
+
+    def recorder(self, samplerate, channels=None, blocksize=None, exclusive_mode=False):
+        return FakeRecorder(samplerate, channels, blocksize, self.tone_hz)
+
+    def record(self, numframes, samplerate, channels=None, blocksize=None):
+        with self.recorder(samplerate, channels, blocksize) as recorder:
+            return recorder.record(numframes)
+
+
+class FakeSpeaker:
+    def __init__(self, name):
+        self.name = name
+        self.id = name
+
+
+class FakeBackend:
+    """Ersatz ohne Audio-Hardware: ein Lautsprecher mit gleichnamiger Loopback-Quelle."""
+
+    name = "fake"
+
+    def __init__(self, device_name=FAKE_DEVICE_NAME, tone_hz=FAKE_TONE_HZ):
+        self.device_name = device_name
+        self.tone_hz = tone_hz
+
+    def default_speaker(self):
+        return FakeSpeaker(self.device_name)
+
+    def all_microphones(self):
+        return [FakeMicrophone(self.device_name, self.tone_hz)]
+
+
+# --- GERÄTESUCHE ---
+
+_backend = None
+_device_cache = {} # Name des Ausgabegeräts -> gefundene Loopback-Quelle
+_lock = threading.Lock()
+
+def set_backend(backend):
+    """Wählt das Backend (z.B. FakeBackend() für Tests) und verwirft die gemerkten Geräte."""
+    global _backend
+    with _lock:
+        _backend = backend
+        _device_cache.clear()
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = FakeBackend() if AUDIO_BACKEND == "fake" else SoundcardBackend()
+        return _backend
+
+def invalidate_device_cache():
+    """Verwirft die gemerkten Geräte, z.B. nachdem ein Gerät entfernt wurde oder sich nicht öffnen ließ."""
+    with _lock:
+        _device_cache.clear()
+
+def _match_rank(mic, speaker_name_lower):
+    """Rang einer Aufnahmequelle für das Ausgabegerät (0 = passt nicht, höher = besser)."""
+    mic_name_lower = mic.name.strip().lower()
+    if mic_name_lower == speaker_name_lower:
+        # Exakter Match (manchmal wird das Wiedergabegerät selbst als Loopback gelistet)
+        rank = 3
+    elif speaker_name_lower in mic_name_lower and ('monitor' in mic_name_lower or 'mix' in mic_name_lower):
+        # Monitor- bzw. Mix-Gerät, das den Namen enthält, ist sehr wahrscheinlich der Loopback
+        rank = 2
+    elif speaker_name_lower in mic_name_lower:
+        # Enthält nur den Namen: letzter Ausweg, falls nichts Besseres gefunden wird
+        rank = 1
+    else:
+        return 0
+    # Bei gleichem Rang gewinnen Quellen, die soundcard ausdrücklich als Loopback kennzeichnet
+    return 2 * rank + bool(getattr(mic, "isloopback", False))
+
+def find_loopback_device(speaker_name, microphones=None):
+    """
+    Sucht das korrespondierende Loopback-Aufnahmegerät basierend auf dem Namen des Standard-Ausgabegeräts.
+    Gibt ein Microphone-Objekt (das als Loopback-Quelle dient) oder None zurück.
+    Ohne microphones wird die Geräteliste des Backends abgefragt (ungecacht, siehe loopback_device).
+    """
+    if microphones is None:
+        microphones = get_backend().all_microphones()
+    speaker_name_lower = speaker_name.strip().lower()
+    best_match = None
+    best_rank = 0
+    for mic in microphones:
+        rank = _match_rank(mic, speaker_name_lower)
+        if rank > best_rank:
+            best_match, best_rank = mic, rank
+    return best_match
+
+def loopback_device(refresh=False):
+    """
+    Gibt (Name des Standard-Ausgabegeräts, Loopback-Quelle oder None) zurück.
+    Die Quelle wird je Ausgabegerät gemerkt; erst bei einem anderen Standardgerät, nach
+    invalidate_device_cache() oder mit refresh=True wird die Geräteliste erneut abgefragt.
+    """
+    backend = get_backend()
+    speaker_name = backend.default_speaker().name
+    with _lock:
+        if not refresh and speaker_name in _device_cache:
+            return speaker_name, _device_cache[speaker_name]
+    device = find_loopback_device(speaker_name, backend.all_microphones())
+    with _lock:
+        # Ein fehlgeschlagener Versuch wird nicht gemerkt, damit ein nachträglich aktiviertes Gerät gefunden wird
+        if device is not None and backend is _backend:
+            _device_cache[speaker_name] = device
+    return speaker_name, device
@@ -1,67 +1,50 @@
 # -*- coding: utf-8 -*-
-import soundcard as sc
-import numpy as np
+import argparse
+import os
 import soundfile as sf
 import time
 import sys
 
+import AudioDevices
+
 # Konfiguration der Aufnahme
 SAMPLERATE = 44100  # Standard-Abtastrate
-DURATION_SECONDS = 10 # Aufnahmedauer in Sekunden
+DURATION_SECONDS = 10 # Aufnahmedauer in Sekunden (None = bis Strg+C)
 CHANNELS = 2        # Stereo-Aufnahme
-FILENAME = "system_audio_aufnahme.wav"
+FILENAME = "system_audio_aufnahme.wav" # Die Endung bestimmt das Format: .wav, .flac oder .ogg
+CHUNK_SECONDS = 0.5 # Größe der Blöcke, die laufend in die Datei geschrieben werden
+FLUSH_SECONDS = 5 # Abstand, in dem die Datei auf die Festplatte geschrieben wird
+# Format und Sample-Format je Dateiendung; FLAC und Ogg Vorbis sind komprimiert und für lange Aufnahmen geeignet
+OUTPUT_FORMATS = {
+    ".wav": ("WAV", "PCM_16"),
+    ".flac": ("FLAC", "PCM_16"),
+    ".ogg": ("OGG", "VORBIS"),
+}
 # Hinweis: Die Puffergröße (Blocksize) wird automatisch von SoundCard/WASAPI verwaltet
 
-def find_loopback_device(speaker_name):
-    """
-    Sucht das korrespondierende Loopback-Aufnahmegerät basierend auf dem Namen des Standard-Ausgabegeräts.
-    Gibt ein Microphone-Objekt (das als Loopback-Quelle dient) oder None zurück.
-    """
-    print(f"Suche Loopback-Quelle für: '{speaker_name}'...")
-    
-    # Ruft alle Mikrofone/Aufnahmegeräte ab, einschließlich der Loopback-Quellen.
-    all_mics = sc.all_microphones(include_loopback=True)
-    
-    # Erwartete Namen für Loopback-Geräte sind oft identisch mit dem Lautsprechernamen
-    # oder enthalten Begriffe wie 'Monitor' oder den Lautsprechernamen selbst.
-    speaker_name_lower = speaker_name.strip().lower()
-    
-    best_match = None
-    
-    for mic in all_mics:
-        mic_name_lower = mic.name.strip().lower()
-        
-        # Exakter Match (manchmal wird das Wiedergabegerät selbst als Loopback gelistet)
-        if mic_name_lower == speaker_name_lower:
-             return mic 
-             
-        # Alternativ: Match, wenn der Sprechername im Mikronamen enthalten ist (häufig für Monitore)
-        if speaker_name_lower in mic_name_lower:
-             # Wenn wir ein 'Monitor' oder 'Mix' Gerät finden, ist das wahrscheinlich der richtige Loopback
-             if 'monitor' in mic_name_lower or 'mix' in mic_name_lower:
-                 return mic
-             # Ansonsten speichern wir es als besten Treffer, falls kein besseres gefunden wird
-             best_match = mic
-    
-    # Rückgabe des besten Matches (oder None)
-    return best_match
-
-
-def record_system_audio():
+
+def open_output_file(filename, samplerate=SAMPLERATE, channels=CHANNELS):
+    """Öffnet die Ausgabedatei im Format passend zur Dateiendung."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(f"Nicht unterstütztes Format '{extension}', möglich sind: {', '.join(OUTPUT_FORMATS)}")
+    file_format, subtype = OUTPUT_FORMATS[extension]
+    return sf.SoundFile(filename, 'w', samplerate=samplerate, channels=channels, format=file_format, subtype=subtype)
+
+
+def record_system_audio(filename=FILENAME, duration=DURATION_SECONDS, samplerate=SAMPLERATE, channels=CHANNELS):
     """
-    Erkennt das Standard-Ausgabegerät, zeichnet dessen Audio-Mix auf (Loopback) 
-    und speichert es in einer WAV-Datei.
+    Erkennt das Standard-Ausgabegerät, zeichnet dessen Audio-Mix auf (Loopback)
+    und schreibt ihn blockweise in eine WAV-, FLAC- oder Ogg-Datei.
+    Der Speicherbedarf hängt nicht von der Dauer ab; ohne duration läuft die Aufnahme bis Strg+C.
     """
     try:
-        # 1. Standard-Ausgabegerät erkennen (Ihr USB-Kopfhörerausgang)
-        default_speaker = sc.default_speaker()
-        speaker_name = default_speaker.name
+        # 1. Standard-Ausgabegerät erkennen (Ihr USB-Kopfhörerausgang) und
+        # 2. explizit nach dem Loopback-Mikrofon suchen (FIX für den '_Speaker' object has no attribute 'record' Fehler)
+        speaker_name, source_device = AudioDevices.loopback_device()
         print("-" * 50)
         print(f"Standard-Ausgabegerät erkannt: {speaker_name}")
-        
-        # 2. Explizit nach dem Loopback-Mikrofon suchen (FIX für den '_Speaker' object has no attribute 'record' Fehler)
-        source_device = find_loopback_device(speaker_name)
-        
+
         if source_device is None:
             # Falls die spezifische Suche fehlschlägt, geben wir eine informative Fehlermeldung aus
             print(f"FEHLER: Das Loopback-Aufnahmegerät für '{speaker_name}' konnte nicht explizit gefunden werden.", file=sys.stderr)
@@ -69,37 +52,64 @@ def record_system_audio():
             print(" - Die 'soundcard'-Bibliothek konnte das korrekte WASAPI-Loopback-Gerät nicht identifizieren.", file=sys.stderr)
             print(" - Das Gerät muss möglicherweise manuell in der Windows-Systemsteuerung aktiviert werden (z.B. 'Stereo Mix' oder 'Wave Out Mix', falls verfügbar).", file=sys.stderr)
             print(" - Versuchen Sie, 'sc.all_microphones(include_loopback=True)' zu drucken, um die verfügbaren Loopback-Namen zu überprüfen.", file=sys.stderr)
-            return
+            return False
 
         # 3. Aufnahme starten
         print(f"Verwende das Loopback-Gerät: '{source_device.name}' als Quelle.")
-        print(f"Starte Aufnahme für {DURATION_SECONDS} Sekunden...")
+        print("Starte Aufnahme " + (f"für {duration:g} Sekunden..." if duration else "bis Strg+C..."))
         print("!!! ACHTUNG: Jetzt müssen Sie Audio auf Ihrem PC abspielen (Chrome, Media Player etc.) !!!")
-        
-        # Die record-Methode auf einem Microphone-Objekt (das die Loopback-Quelle ist)
-        audio_data = source_device.record(
-            samplerate=SAMPLERATE, 
-            numframes=SAMPLERATE * DURATION_SECONDS, 
-            channels=CHANNELS
-        )
-        
+
+        chunk_frames = max(1, int(samplerate * CHUNK_SECONDS))
+        total_frames = int(samplerate * duration) if duration else None
+        frames_written = 0
+        last_flush = time.perf_counter()
+
+        # Die Blöcke gehen sofort in die Datei, statt die ganze Aufnahme im Speicher zu sammeln
+        with open_output_file(filename, samplerate, channels) as output, \
+             source_device.recorder(samplerate=samplerate, channels=channels) as recorder:
+            try:
+                while total_frames is None or frames_written < total_frames:
+                    numframes = chunk_frames if total_frames is None else min(chunk_frames, total_frames - frames_written)
+                    data = recorder.record(numframes=numframes)
+                    output.write(data)
+                    frames_written += len(data)
+                    if time.perf_counter() - last_flush >= FLUSH_SECONDS:
+                        output.flush()
+                        last_flush = time.perf_counter()
+            except KeyboardInterrupt:
+                print("\nAbbruch durch Benutzer, Aufnahme wird beendet...")
+
         print("Aufnahme beendet.")
-        
-        # 4. Speichern der Daten
-        sf.write(FILENAME, audio_data, SAMPLERATE)
-        
         print("-" * 50)
-        print(f"Erfolgreich gespeichert unter: {FILENAME}")
-        print(f"Aufgenommene Datenform: {audio_data.shape}")
+        print(f"Erfolgreich gespeichert unter: {filename}")
+        print(f"Aufgenommen: {frames_written / samplerate:.1f} s ({frames_written} Frames, {channels} Kanäle)")
+        return True
 
     except Exception as e:
+        # Das gemerkte Gerät könnte entfernt worden sein
+        AudioDevices.invalidate_device_cache()
         print("-" * 50)
         print(f"FEHLER bei der Audio-Aufnahme: {e}", file=sys.stderr)
         print("Mögliche Ursachen:")
         print("1. 'soundcard' konnte nicht auf die WASAPI-Schnittstelle zugreifen (Versuchen Sie, das Skript als Administrator auszuführen).")
         print("2. Allgemeine Initialisierungsprobleme (z. B. fehlende Berechtigungen oder gesperrter exklusiver Modus).")
         print("-" * 50)
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nimmt das System-Audio (Loopback) in eine WAV-, FLAC- oder Ogg-Datei auf.")
+    parser.add_argument("--output", default=FILENAME, help=f"Ausgabedatei, Format nach Endung (Standard: {FILENAME})")
+    parser.add_argument("--duration", type=float, default=DURATION_SECONDS,
+                        help=f"Aufnahmedauer in Sekunden, 0 = bis Strg+C (Standard: {DURATION_SECONDS})")
+    parser.add_argument("--fake", action="store_true",
+                        help="Ersatzgerät mit Sinuston statt echter Hardware verwenden (zum Testen)")
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        AudioDevices.set_backend(AudioDevices.FakeBackend())
+    return 0 if record_system_audio(args.output, args.duration or None) else 1
 
 
 if __name__ == "__main__":
-    record_system_audio()
+    sys.exit(main())
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Headless-Benchmark für den Aufnahmepfad von VideoRecorder.py.
+
+Ersetzt mss und soundcard durch synthetische Quellen, so dass die echte Pipeline
+(Aufnahme -> Konvertierung -> Kodierung, Audio-Schreib-Thread) ohne Bildschirm und ohne
+Loopback-Gerät läuft, z.B. auf einem Linux-CI-Server.
+
+Beispiel:
+    python Benchmark.py --duration 10 --resolution 1280x720 --resolution 1920x1080 --content noise
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+import AudioDevices
+
+# --- SYNTHETISCHE BILDQUELLE (Ersatz für mss) ---
+
+CONTENT_TYPES = ("static", "scroll", "noise")
+# Zwei nebeneinanderliegende Monitore (für die Gruppierung mehrerer Bereiche je Monitor)
+FAKE_MONITORS = (
+    {"left": 0, "top": 0, "width": 1920, "height": 1080},
+    {"left": 1920, "top": 0, "width": 1920, "height": 1080},
+)
+
+class FakeScreenShot:
+    """Bildet die von VideoRecorder genutzten Attribute von mss.screenshot.ScreenShot nach."""
+
+    def __init__(self, raw, width, height):
+        self.raw = raw
+        self.width = width
+        self.height = height
+        self.size = (width, height)
+
+
+class FakeScreenGrabber:
+    """
+    Ersatz für mss.mss(): Liefert BGRA-Frames in der angeforderten Größe.
+    "static" liefert immer dasselbe Bild, "scroll" einen laufenden Verlauf,
+    "noise" Zufallsbilder (schlechtester Fall für den Encoder).
+    monitors folgt mss: Eintrag 0 umschließt alle Monitore, danach je ein Eintrag pro Monitor.
+    """
+
+    def __init__(self, content="scroll", monitors=FAKE_MONITORS):
+        if content not in CONTENT_TYPES:
+            raise ValueError(f"Unbekannter Bildinhalt '{content}', erlaubt sind: {', '.join(CONTENT_TYPES)}")
+        self.content = content
+        left = min(monitor["left"] for monitor in monitors)
+        top = min(monitor["top"] for monitor in monitors)
+        right = max(monitor["left"] + monitor["width"] for monitor in monitors)
+        bottom = max(monitor["top"] + monitor["height"] for monitor in monitors)
+        self.monitors = [{"left": left, "top": top, "width": right - left, "height": bottom - top}]
+        self.monitors += [dict(monitor) for monitor in monitors]
+        self._frames = {} # Vorab erzeugte Bilder je Auflösung
+        self._tick = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _source(self, width, height):
+        key = (width, height)
+        if key not in self._frames:
+            if self.content == "noise":
+                rng = np.random.default_rng(0)
+                self._frames[key] = [rng.integers(0, 256, (height, width, 4), dtype=np.uint8) for _ in range(8)]
+            else:
+                # Doppelt hoher Verlauf, aus dem beim Scrollen ein Fenster ausgeschnitten wird
+                rows = np.linspace(0, 255, 2 * height, dtype=np.uint8)[:, None]
+                cols = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+                image = np.empty((2 * height, width, 4), dtype=np.uint8)
+                image[..., 0] = rows
+                image[..., 1] = cols
+                image[..., 2] = rows ^ cols
+                image[..., 3] = 255
+                self._frames[key] = image
+        return self._frames[key]
+
+    def grab(self, monitor):
+        width, height = monitor["width"], monitor["height"]
+        source = self._source(width, height)
+        self._tick += 1
+        if self.content == "noise":
+            frame = source[self._tick % len(source)]
+        elif self.content == "scroll":
+            offset = (self._tick * 4) % height
+            frame = source[offset:offset + height]
+        else:
+            frame = source[:height]
+        # mss legt für jeden Screenshot einen neuen bytearray an, das wird hier nachgebildet
+        return FakeScreenShot(bytearray(memoryview(np.ascontiguousarray(frame))), width, height)
+
+
+FAKE_DEVICE_NAME = "Benchmark Loopback"
+
+def install_fake_devices(content="scroll"):
+    """Registriert das Ersatzmodul für mss und das Ersatz-Backend für Audio, bevor VideoRecorder importiert wird."""
+    fake_mss = types.ModuleType("mss")
+    fake_mss.mss = lambda **kwargs: FakeScreenGrabber(content)
+    sys.modules["mss"] = fake_mss
+
+    # Audio: Sinuston im Echtzeittakt über das Ersatz-Backend der gemeinsamen Geräteerkennung
+    AudioDevices.set_backend(AudioDevices.FakeBackend(FAKE_DEVICE_NAME))
+
+
+# --- MESSUNG ---
+
+class StageTimings:
+    """Sammelt die Laufzeiten je Pipeline-Stufe (Parameter timings von VideoRecorder.Recorder)."""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def percentiles(self):
+        result = {}
+        for stage, values in self.samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[stage] = {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000, "max_ms": max(values) * 1000}
+        return result
+
+
+def peak_rss_mb():
+    """Maximaler Arbeitsspeicher des Prozesses in MB (None, wenn nicht ermittelbar)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux liefert KB, macOS Bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+ALLOCATION_WARMUP_SECONDS = 1.0 # Erst danach wird gemessen: Puffer, Pool und Warteschlangen sind dann angelegt
+
+def measure_allocations(recorder, duration, warmup=ALLOCATION_WARMUP_SECONDS):
+    """
+    Wartet duration Sekunden und misst nach der Aufwärmphase mit tracemalloc alle Python- und NumPy-Allokationen
+    des Prozesses (alle Threads, auch die Puffer der Bildquelle). Gibt den bleibenden Zuwachs je Frame und
+    den größten vorübergehend zusätzlich belegten Speicher zurück.
+    """
+    warmup = min(warmup, duration / 2)
+    time.sleep(warmup)
+    tracemalloc.start()
+    try:
+        # Die Snapshots selbst werden nicht mitgezählt
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        frames_before = recorder._timestamps.count
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        time.sleep(duration - warmup)
+        frames = recorder._timestamps.count - frames_before
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+    finally:
+        tracemalloc.stop()
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return {
+        "frames": frames,
+        "retained_bytes_per_frame": growth / frames if frames else 0.0,
+        "peak_extra_mb": (peak - baseline) / 1048576,
+    }
+
+
+class SlowVideoWriter:
+    """Verzögert jeden geschriebenen Zeitschlitz eines cv2.VideoWriter (simuliert einen langsamen Encoder)."""
+
+    def __init__(self, writer, delay):
+        self._writer = writer
+        self._delay = delay
+
+    def write(self, frame):
+        time.sleep(self._delay)
+        self._writer.write(frame)
+
+    def release(self):
+        self._writer.release()
+
+
+def run_benchmark(videorecorder, width, height, duration, workdir, fps, output_size=None, adaptive=False,
+                  encode_delay_ms=0, trace_allocations=False):
+    """
+    Führt eine Aufnahme mit der echten Pipeline von VideoRecorder aus und gibt die Messwerte zurück.
+    Mit output_size wird der Bereich width x height aufgenommen und auf diese Größe skaliert geschrieben.
+    Mit encode_delay_ms dauert jeder geschriebene Zeitschlitz entsprechend länger (z.B. um die Regelung zu prüfen).
+    Mit trace_allocations werden die Allokationen gemessen (siehe measure_allocations); tracemalloc bremst die
+    Aufnahme dabei deutlich, die übrigen Messwerte sind dann nicht aussagekräftig.
+    """
+    import soundfile as sf
+
+    timings = StageTimings()
+    avi_writer = videorecorder.AviWriter
+    if encode_delay_ms:
+        class SlowAviWriter(avi_writer):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._writer = SlowVideoWriter(self._writer, encode_delay_ms / 1000.0)
+        videorecorder.AviWriter = SlowAviWriter
+    # Der Benchmark misst die Aufnahme mit AVI-Zwischendatei, FFmpeg wird nicht benötigt
+    recorder = videorecorder.Recorder({"top": 0, "left": 0, "width": width, "height": height},
+                                      os.path.join(workdir, f"bench_{width}x{height}.mp4"), fps=fps, mode="avi",
+                                      timings=timings, output_size=output_size, adaptive=adaptive)
+    try:
+        recorder.start()
+        if trace_allocations:
+            allocations = measure_allocations(recorder, duration)
+        else:
+            allocations = None
+            time.sleep(duration)
+        recorder.stop()
+    finally:
+        videorecorder.AviWriter = avi_writer
+    controller = recorder._capture.controller
+
+    timestamps, audio_start = videorecorder.load_timestamps(recorder.timestamp_path)
+    intervals = np.diff(np.asarray(timestamps, dtype=np.float64))
+    video_end = timestamps[-1] + 1.0 / fps
+    audio_frames = sf.info(recorder.audio_path).frames
+    audio_end = audio_start + audio_frames / videorecorder.SAMPLERATE
+
+    return {
+        "resolution": f"{width}x{height}",
+        "output_resolution": "{}x{}".format(*recorder.frame_size),
+        "target_fps": fps,
+        "achieved_fps": (len(timestamps) - 1) / (timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0.0,
+        "frames": len(timestamps),
+        "interval_mean_ms": float(intervals.mean() * 1000) if len(intervals) else 0.0,
+        "interval_jitter_ms": float(intervals.std() * 1000) if len(intervals) else 0.0,
+        "interval_max_ms": float(intervals.max() * 1000) if len(intervals) else 0.0,
+        "stages": timings.percentiles(),
+        "av_start_offset_ms": (timestamps[0] - audio_start) * 1000,
+        "av_end_drift_ms": (audio_end - video_end) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "allocations": allocations,
+        # Änderungen der Aufnahmerate durch die adaptive Regelung: (Sekunden, alte Rate, neue Rate, Grund)
+        "rate_changes": controller.adjustments if controller is not None else [],
+        "final_capture_fps": controller.fps if controller is not None else fps,
+    }
+
+
+def print_result(result):
+    print("-" * 60)
+    resolution = result["resolution"]
+    if result["output_resolution"] != resolution:
+        resolution += f" -> {result['output_resolution']}"
+    print(f"Auflösung {resolution}: {result['achieved_fps']:.2f} von {result['target_fps']} FPS ({result['frames']} Frames)")
+    print(f"Frame-Abstand: Mittel {result['interval_mean_ms']:.2f} ms, Jitter {result['interval_jitter_ms']:.2f} ms, Max {result['interval_max_ms']:.2f} ms")
+    for stage, values in result["stages"].items():
+        print(f"  {stage:<8} p50 {values['p50_ms']:7.2f} ms  p95 {values['p95_ms']:7.2f} ms  p99 {values['p99_ms']:7.2f} ms  max {values['max_ms']:7.2f} ms")
+    print(f"A/V: Startversatz {result['av_start_offset_ms']:.1f} ms, Drift am Ende {result['av_end_drift_ms']:.1f} ms")
+    if result["rate_changes"]:
+        print(f"Regelung: {len(result['rate_changes'])} Änderungen, am Ende {result['final_capture_fps']:g} FPS Aufnahmerate")
+    if result["peak_rss_mb"] is not None:
+        print(f"Maximaler Speicher (Prozess): {result['peak_rss_mb']:.1f} MB")
+    allocations = result["allocations"]
+    if allocations is not None:
+        print(f"Allokationen (tracemalloc, {allocations['frames']} Frames): bleibend "
+              f"{allocations['retained_bytes_per_frame']:.0f} Bytes/Frame, vorübergehend zusätzlich bis "
+              f"{allocations['peak_extra_mb']:.1f} MB")
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless-Benchmark für den Aufnahmepfad von VideoRecorder.py")
+    parser.add_argument("--duration", type=float, default=10.0, help="Aufnahmedauer je Auflösung in Sekunden")
+    parser.add_argument("--resolution", action="append", type=parse_resolution, help="Auflösung BxH, mehrfach angebbar (Standard: 1920x1080)")
+    parser.add_argument("--scale", action="append", type=parse_resolution,
+                        help="Ausgabegröße BxH, mehrfach angebbar; jede Auflösung wird je Ausgabegröße gemessen")
+    parser.add_argument("--content", choices=CONTENT_TYPES, default="scroll", help="Bildinhalt der synthetischen Quelle")
+    parser.add_argument("--fps", type=int, help="Ziel-Framerate (Standard: FPS aus VideoRecorder.py)")
+    parser.add_argument("--policy", help="Queue-Policy (Standard: QUEUE_FULL_POLICY aus VideoRecorder.py)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Adaptive Regelung der Aufnahmerate einschalten (Standard: aus, gemessen wird die volle Rate)")
+    parser.add_argument("--encode-delay", type=float, default=0, metavar="MS",
+                        help="Jeden geschriebenen Frame um MS verzögern (langsamer Encoder, z.B. mit --adaptive)")
+    parser.add_argument("--allocations", action="store_true",
+                        help="Allokationen pro Frame mit tracemalloc messen (bremst die Aufnahme)")
+    parser.add_argument("--json", help="Ergebnisse zusätzlich als JSON in diese Datei schreiben")
+    parser.add_argument("--min-fps", type=float, help="Mit Fehlercode beenden, wenn eine Auflösung diese Framerate unterschreitet")
+    args = parser.parse_args()
+
+    install_fake_devices(args.content)
+    import VideoRecorder as videorecorder
+
+    if args.policy:
+        videorecorder.QUEUE_FULL_POLICY = args.policy
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="videorecorder_bench_") as workdir:
+        for width, height in args.resolution or [(1920, 1080)]:
+            for output_size in args.scale or [None]:
+                result = run_benchmark(videorecorder, width, height, args.duration, workdir, args.fps or videorecorder.FPS,
+                                       output_size, args.adaptive, args.encode_delay, args.allocations)
+                print_result(result)
+                results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"content": args.content, "results": results}, f, indent=2)
+        print(f"Ergebnisse unter {args.json} gespeichert.")
+
+    if args.min_fps is not None and any(result["achieved_fps"] < args.min_fps for result in results):
+        print(f"FEHLER: Mindestens eine Auflösung liegt unter {args.min_fps} FPS.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
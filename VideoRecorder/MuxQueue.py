@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Warteschlange für das Zusammenführen von Aufnahmen aus VideoRecorder.py.
+
+Durchsucht ein Verzeichnis nach abgeschlossenen Aufnahmen (AVI-/WAV-Zwischendateien mit
+Zeitstempeln sowie Sitzungsverzeichnisse des Modus "segmented") und führt sie mit begrenzter
+Parallelität per FFmpeg zusammen. Bereits fertige Aufnahmen werden übersprungen, jede Aufnahme
+wird über eine Sperrdatei nur von einem Prozess bearbeitet. Je Verzeichnis arbeitet außerdem nur eine
+Warteschlange (Sperrdatei muxqueue.lock), weitere Aufrufe beenden sich sofort und überlassen ihr neue
+Aufnahmen. Dadurch kann das Skript beliebig oft und gleichzeitig gestartet werden, z.B. von
+VideoRecorder.py --defer nach jeder Aufnahme, ohne dass mehr als MAX_JOBS Aufnahmen gleichzeitig kodiert werden.
+
+Beispiel:
+    python MuxQueue.py aufnahmen --jobs 2 --watch 30
+"""
+import argparse
+import concurrent.futures
+import os
+import socket
+import sys
+import threading
+import time
+
+import VideoRecorder as videorecorder
+
+# --- KONFIGURATION ---
+MAX_JOBS = 2 # Anzahl gleichzeitig laufender Aufnahmen; die CPU-Kerne werden unter ihnen aufgeteilt
+IDLE_SECONDS = 120 # Unvollständige Sitzungen ohne Änderung seit dieser Zeit gelten als abgebrochen und werden trotzdem zusammengeführt
+LOCK_STALE_SECONDS = 6 * 3600 # Ältere Sperrdateien stammen von einem abgestürzten Prozess und werden ignoriert
+PROGRESS_INTERVAL_SECONDS = 2 # Mindestabstand zwischen zwei Fortschrittsmeldungen desselben Auftrags
+QUEUE_LOCK_FILENAME = "muxqueue.lock" # Sperre der Warteschlange eines Verzeichnisses
+QUEUE_LOCK_REFRESH_SECONDS = 30 # Abstand, in dem die laufende Warteschlange ihre Sperre auffrischt
+QUEUE_LOCK_STALE_SECONDS = 120 # Nicht aufgefrischte Sperren einer Warteschlange stammen von einem abgestürzten Prozess
+
+_print_lock = threading.Lock()
+
+def log(message, file=sys.stdout):
+    """Gibt eine Zeile aus, ohne dass sich die Meldungen paralleler Aufträge vermischen."""
+    with _print_lock:
+        print(message, file=file, flush=True)
+
+def is_finished(output_path, sources_changed=None):
+    """
+    Eine Ausgabe gilt als fertig, wenn sie existiert und nicht nur ein leerer Platzhalter ist.
+    Mit sources_changed (letzte Änderung der Zwischendateien) muss sie außerdem jünger sein; eine ältere
+    Datei gleichen Namens stammt aus einem früheren Lauf (z.B. mit --output) und wird überschrieben.
+    """
+    try:
+        return os.path.getsize(output_path) > 0 and (sources_changed is None
+                                                     or os.path.getmtime(output_path) >= sources_changed)
+    except OSError:
+        return False
+
+def newest_change(path):
+    """Zeitpunkt der letzten Änderung einer Datei oder eines Verzeichnisses samt Inhalt."""
+    newest = os.path.getmtime(path)
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(directory, name)))
+            except OSError:
+                pass
+    return newest
+
+
+# --- AUFTRÄGE ---
+
+class MuxJob:
+    """Eine zusammenzuführende Aufnahme: entweder ein Sitzungsverzeichnis oder AVI + WAV + Zeitstempel."""
+
+    def __init__(self, name, output_path, lock_path, sources_changed, session_dir=None, stem=None):
+        self.name = name
+        self.output_path = output_path
+        self.lock_path = lock_path
+        self.sources_changed = sources_changed # Letzte Änderung der Zwischendateien, siehe is_finished
+        self.session_dir = session_dir
+        self.stem = stem
+
+    def sources_exist(self):
+        if self.session_dir is not None:
+            return os.path.isdir(self.session_dir)
+        return os.path.exists(self.stem + "_" + videorecorder.TIMESTAMP_FILENAME)
+
+    def run(self, on_progress):
+        if self.session_dir is not None:
+            return videorecorder.finalize_session(self.session_dir, self.output_path, on_progress)
+        timestamp_path = self.stem + "_" + videorecorder.TIMESTAMP_FILENAME
+        # Raster und Sync-Modus der Aufnahme stehen im Kopf des Zeitstempel-Protokolls
+        header = videorecorder.read_timestamp_log_header(timestamp_path)
+        ok = videorecorder.mux_files_with_ffmpeg(
+            self.stem + "_" + videorecorder.VIDEO_FILENAME, self.stem + "_" + videorecorder.AUDIO_FILENAME,
+            self.output_path, timestamp_path, header["fps"], header["sync_mode"], on_progress)
+        if ok:
+            videorecorder.remove_recording_meta(self.stem)
+        return ok
+
+def session_job(session_dir):
+    """Auftrag für ein Sitzungsverzeichnis oder (None, Grund), wenn es nicht zusammengeführt werden soll."""
+    try:
+        meta = videorecorder.load_session_meta(session_dir)
+    except (OSError, ValueError) as e:
+        return None, f"Metadaten nicht lesbar ({e})"
+    if meta.get("finished"):
+        return None, "bereits fertig"
+    changed = newest_change(session_dir)
+    if not meta.get("complete") and time.time() - changed < IDLE_SECONDS:
+        return None, "Aufnahme läuft noch"
+    # Sitzungen ohne hinterlegtes Ziel erhalten einen festen Namen, damit wiederholte Läufe sie als fertig erkennen
+    output_path = meta.get("output") or session_dir.rstrip(os.sep) + os.path.splitext(videorecorder.OUTPUT_FILENAME)[1]
+    if is_finished(output_path, changed):
+        return None, f"bereits fertig ({output_path})"
+    return MuxJob(os.path.basename(session_dir), output_path, os.path.join(session_dir, "finalize.lock"), changed,
+                  session_dir=session_dir), None
+
+def recording_job(stem):
+    """Auftrag für eine Aufnahme im Modus "avi" oder (None, Grund)."""
+    paths = [f"{stem}_{suffix}" for suffix in (videorecorder.VIDEO_FILENAME, videorecorder.AUDIO_FILENAME)]
+    for path in paths:
+        if not os.path.exists(path):
+            return None, f"{os.path.basename(path)} fehlt"
+    timestamp_path = f"{stem}_{videorecorder.TIMESTAMP_FILENAME}"
+    try:
+        header = videorecorder.read_timestamp_log_header(timestamp_path)
+    except (OSError, ValueError) as e:
+        return None, f"Zeitstempel nicht lesbar ({e})"
+    # Abgeschlossen wird das Protokoll erst nach dem Schließen von Video- und Audiodatei;
+    # ohne Abschluss und ohne Änderung seit IDLE_SECONDS ist die Aufnahme abgebrochen (Absturz)
+    changed = max(newest_change(path) for path in paths + [timestamp_path])
+    if not header["complete"] and time.time() - changed < IDLE_SECONDS:
+        return None, "Aufnahme läuft noch"
+    try:
+        meta = videorecorder.load_recording_meta(stem)
+    except (OSError, ValueError) as e:
+        return None, f"Metadaten nicht lesbar ({e})"
+    # Gewählte Ausgabedatei wie bei Sitzungen, sonst (ältere Aufnahmen) der Stamm mit der Standard-Endung
+    output_path = meta.get("output") or stem + os.path.splitext(videorecorder.OUTPUT_FILENAME)[1]
+    if is_finished(output_path, changed):
+        return None, f"bereits fertig ({output_path})"
+    return MuxJob(os.path.basename(stem), output_path, stem + ".lock", changed, stem=stem), None
+
+def find_jobs(directory):
+    """Sucht alle zusammenzuführenden Aufnahmen eines Verzeichnisses. Gibt (Aufträge, [(Name, Grund), ...]) zurück."""
+    jobs = []
+    skipped = []
+    suffix = "_" + videorecorder.TIMESTAMP_FILENAME
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        if os.path.isfile(os.path.join(path, videorecorder.SESSION_META_FILENAME)):
+            job, reason = session_job(path)
+        elif entry.endswith(suffix):
+            job, reason = recording_job(path[:-len(suffix)])
+        else:
+            continue
+        if job is not None:
+            jobs.append(job)
+        else:
+            skipped.append((entry, reason))
+    return jobs, skipped
+
+
+# --- SPERREN ---
+
+def acquire_lock(lock_path, stale_seconds=LOCK_STALE_SECONDS):
+    """Legt die Sperrdatei exklusiv an. False, wenn ein anderer Prozess die Aufnahme (bzw. das Verzeichnis) gerade bearbeitet."""
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            age = time.time() - os.path.getmtime(lock_path)
+        except OSError:
+            return False
+        if age < stale_seconds:
+            return False
+        log(f"Verwaiste Sperre {lock_path} ({age / 3600:.1f} h alt) wird entfernt.")
+        try:
+            os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(f"{socket.gethostname()} {os.getpid()}\n")
+    return True
+
+def refresh_lock(lock_path, stop_event):
+    """Frischt die Sperre der Warteschlange auf, bis stop_event gesetzt wird (eigener Thread)."""
+    while not stop_event.wait(QUEUE_LOCK_REFRESH_SECONDS):
+        try:
+            os.utime(lock_path)
+        except OSError:
+            pass
+
+def release_lock(lock_path):
+    # Bei Sitzungen verschwindet die Sperre nach dem Erfolg zusammen mit dem Verzeichnis
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+# --- AUSFÜHRUNG ---
+
+class ProgressPrinter:
+    """Gibt den von FFmpeg gestreamten Fortschritt eines Auftrags gedrosselt aus."""
+
+    def __init__(self, name):
+        self.name = name
+        self._last_print = 0.0
+
+    def __call__(self, progress):
+        now = time.monotonic()
+        if progress.get("progress") != "end" and now - self._last_print < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_print = now
+        try:
+            position = int(progress.get("out_time_us", "")) / 1e6
+        except ValueError:
+            position = 0.0
+        speed = videorecorder.ffmpeg_speed(progress)
+        speed_text = f", {speed:.2f}x Echtzeit" if speed is not None else ""
+        log(f"[{self.name}] {position:.1f} s kodiert{speed_text}")
+
+def run_job(job):
+    """Führt einen Auftrag unter seiner Sperre aus. Gibt True (Erfolg), False (Fehler) oder None (übersprungen) zurück."""
+    if not acquire_lock(job.lock_path):
+        log(f"[{job.name}] wird bereits von einem anderen Prozess bearbeitet.")
+        return None
+    try:
+        # Zwischen Suche und Sperre kann ein anderer Prozess die Aufnahme bereits fertiggestellt haben
+        if is_finished(job.output_path, job.sources_changed) or not job.sources_exist():
+            log(f"[{job.name}] inzwischen fertig.")
+            return None
+        log(f"[{job.name}] wird nach {job.output_path} zusammengeführt.")
+        started = time.perf_counter()
+        ok = job.run(ProgressPrinter(job.name))
+        if ok:
+            log(f"[{job.name}] fertig nach {time.perf_counter() - started:.1f} s.")
+        else:
+            log(f"[{job.name}] FEHLER beim Zusammenführen, die Zwischendateien bleiben erhalten.", file=sys.stderr)
+        return ok
+    except Exception as e:
+        log(f"[{job.name}] FEHLER: {e}", file=sys.stderr)
+        return False
+    finally:
+        release_lock(job.lock_path)
+
+def process_directory(directory, jobs=MAX_JOBS, watch=None):
+    """
+    Arbeitet alle Aufnahmen eines Verzeichnisses ab; mit watch wird es in diesem Abstand (Sekunden) erneut durchsucht.
+    Läuft für das Verzeichnis bereits eine Warteschlange, kehrt die Funktion sofort zurück.
+    """
+    lock_path = os.path.join(directory, QUEUE_LOCK_FILENAME)
+    submitted = set()
+    failures = 0
+    while acquire_lock(lock_path, QUEUE_LOCK_STALE_SECONDS):
+        stop_refresh = threading.Event()
+        threading.Thread(target=refresh_lock, args=(lock_path, stop_refresh), name="queue-lock", daemon=True).start()
+        try:
+            failures += work_queue(directory, jobs, watch, submitted)
+        finally:
+            stop_refresh.set()
+            release_lock(lock_path)
+        # Ein Aufruf kurz vor der Freigabe ist an der Sperre gescheitert und verlässt sich auf diese Warteschlange
+        if not any(job.name not in submitted for job in find_jobs(directory)[0]):
+            return failures
+    if not submitted:
+        log(f"Für {directory} läuft bereits eine Warteschlange, sie übernimmt auch neue Aufnahmen.")
+    return failures
+
+def work_queue(directory, jobs, watch, submitted):
+    """
+    Führt die Aufträge eines Verzeichnisses mit höchstens jobs gleichzeitigen Aufnahmen aus (unter der Sperre
+    der Warteschlange). Nach jedem fertigen Auftrag wird erneut gesucht, damit auch ohne watch später
+    abgelegte Aufnahmen übernommen werden. Gibt die Anzahl fehlgeschlagener Aufträge zurück.
+    """
+    # Die parallelen Aufträge teilen sich die CPU-Kerne, statt dass jeder Auftrag alle belegt
+    videorecorder.ENCODE_WORKERS = max(1, (os.cpu_count() or 1) // jobs)
+    failures = 0
+    first_scan = True
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="mux") as executor:
+        running = {}
+        while True:
+            found, skipped = find_jobs(directory)
+            if watch is None and first_scan:
+                for name, reason in skipped:
+                    log(f"[{name}] übersprungen: {reason}")
+            first_scan = False
+            for job in found:
+                if job.name not in submitted:
+                    submitted.add(job.name)
+                    running[executor.submit(run_job, job)] = job
+            if not running:
+                if watch is None:
+                    return failures
+                # wait() kehrt ohne laufende Aufträge sofort zurück, das Verzeichnis würde ununterbrochen durchsucht
+                time.sleep(watch)
+                continue
+            done, _ = concurrent.futures.wait(running, timeout=watch, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                if future.result() is False:
+                    failures += 1
+                if watch is not None:
+                    # Fehlgeschlagene Aufträge werden beim nächsten Durchsuchen erneut versucht
+                    submitted.discard(job.name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Führt abgeschlossene Aufnahmen von VideoRecorder.py parallel zusammen")
+    parser.add_argument("directory", nargs="?", default=".", help="Zu durchsuchendes Verzeichnis (Standard: aktuelles Verzeichnis)")
+    parser.add_argument("--jobs", type=int, default=MAX_JOBS, help="Anzahl gleichzeitig zusammengeführter Aufnahmen")
+    parser.add_argument("--watch", type=float, metavar="SEKUNDEN",
+                        help="Nicht beenden, sondern das Verzeichnis in diesem Abstand erneut durchsuchen")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs muss mindestens 1 sein")
+
+    try:
+        failures = process_directory(args.directory, args.jobs, args.watch)
+    except KeyboardInterrupt:
+        log("Abgebrochen.", file=sys.stderr)
+        return 130
+    if failures:
+        log(f"{failures} Aufnahme(n) konnten nicht zusammengeführt werden.", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
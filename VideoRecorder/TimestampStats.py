@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Liest Zeitstempel-Protokolle von VideoRecorder.py (*_timestamps.bin bzw. die Abschnitte eines
+Sitzungsverzeichnisses) und gibt Kennzahlen zu Frame-Abständen und Jitter aus.
+
+Beispiel:
+    python TimestampStats.py output_timestamps.bin
+    python TimestampStats.py aufnahme_sitzung_20250101_120000 --json statistik.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+import VideoRecorder as videorecorder
+
+
+def load(path):
+    """Lädt ein Protokoll oder alle Abschnitte einer Sitzung. Gibt (Zeitstempel, Kopf des ersten Protokolls) zurück."""
+    if not os.path.isdir(path):
+        return videorecorder.read_timestamp_log(path)
+    parts = sorted(glob.glob(os.path.join(path, "timestamps_*.bin")))
+    if not parts:
+        raise ValueError(f"'{path}' enthält keine Zeitstempel-Protokolle")
+    logs = [videorecorder.read_timestamp_log(part) for part in parts]
+    header = logs[0][1]
+    if header["audio_start"] is None:
+        # Ein Abschnitt, der vor dem ersten Audioblock geschlossen wurde, kennt die Audio-Startzeit noch nicht
+        try:
+            header = dict(header, audio_start=videorecorder.load_session_meta(path).get("audio_start"))
+        except (OSError, ValueError):
+            pass
+    return np.concatenate([timestamps for timestamps, _ in logs]), header
+
+
+def print_statistics(path, stats, header):
+    print(f"{path}:")
+    state = "abgeschlossen" if header["complete"] else "nicht abgeschlossen (Aufnahme läuft oder abgebrochen)"
+    print(f"  Protokoll: {header['fps']:g} FPS, Sync-Modus '{header['sync_mode']}', {state}")
+    if stats["frames"] < 2:
+        print(f"  Nur {stats['frames']} Frame(s), keine Abstände auswertbar.")
+        return
+    print(f"  Frames: {stats['frames']} in {stats['duration']:.2f} s, erreicht {stats['achieved_fps']:.2f} FPS")
+    print(f"  Frame-Abstand: Mittel {stats['interval_mean_ms']:.2f} ms, Jitter {stats['jitter_ms']:.2f} ms, "
+          f"p50 {stats['interval_p50_ms']:.2f} ms, p95 {stats['interval_p95_ms']:.2f} ms, "
+          f"p99 {stats['interval_p99_ms']:.2f} ms, Max {stats['interval_max_ms']:.2f} ms")
+    print(f"  Lücken: {stats['gaps']} (etwa {stats['missing_frames']} fehlende Frames), "
+          f"nicht monoton: {stats['non_monotonic']}")
+    print(f"  Größte Abweichung gegenüber gemittelter Rate: {stats['max_average_rate_offset_ms']:.1f} ms")
+    if header["audio_start"] is not None:
+        print(f"  Start-Versatz Video zu Audio: {(stats['first'] - header['audio_start']) * 1000:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Jitter-Statistik für Zeitstempel-Protokolle von VideoRecorder.py")
+    parser.add_argument("paths", nargs="+", metavar="PROTOKOLL", help="Zeitstempel-Protokoll oder Sitzungsverzeichnis")
+    parser.add_argument("--fps", type=float, help="Raster für die Lückenerkennung (Standard: FPS aus dem Protokoll)")
+    parser.add_argument("--json", help="Kennzahlen zusätzlich als JSON in diese Datei schreiben")
+    args = parser.parse_args(argv)
+
+    results = {}
+    failed = False
+    for path in args.paths:
+        try:
+            timestamps, header = load(path)
+        except (OSError, ValueError) as e:
+            print(f"FEHLER: {path}: {e}", file=sys.stderr)
+            failed = True
+            continue
+        stats = videorecorder.timestamp_statistics(timestamps, args.fps or header["fps"])
+        if len(timestamps):
+            stats["first"] = float(timestamps[0])
+        print_statistics(path, stats, header)
+        results[path] = dict(stats, **header)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
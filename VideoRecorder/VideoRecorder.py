@@ -1,60 +1,379 @@
 
-import cv2
-import mss
-import numpy as np
 import threading
 import time
-import tkinter as tk
 import subprocess 
-import soundcard as sc
-import soundfile as sf
 import sys
 import os 
 import json
+import queue
+import socket
+import collections
+import shutil
+import concurrent.futures
+import importlib
+import argparse
+import bisect
+import struct
+
+import AudioDevices
+
+class _LazyModule:
+    """
+    Platzhalter, der ein Modul erst beim ersten Attributzugriff importiert.
+    Eine Aufnahme ohne GUI startet dadurch schnell, und tkinter wird nur geladen,
+    wenn das Auswahlfenster tatsächlich gebraucht wird.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attribute)
+
+cv2 = _LazyModule("cv2")
+mss = _LazyModule("mss")
+np = _LazyModule("numpy")
+tk = _LazyModule("tkinter")
+sf = _LazyModule("soundfile")
 
 # --- Konfiguration ---
 VIDEO_FILENAME = "aufnahme.avi"
 AUDIO_FILENAME = "aufnahme.wav"
 OUTPUT_FILENAME = "output.mp4" 
-TIMESTAMP_FILENAME = "timestamps.json" # Neue Datei für Zeitstempel
+TIMESTAMP_FILENAME = "timestamps.bin" # Zeitstempel der Frames (binär, siehe TimestampLog)
+RECORDING_META_FILENAME = "aufnahme.json" # Gewählte Ausgabedatei einer Aufnahme im Modus "avi" (für MuxQueue.py)
 FPS = 30 # Standard-Framerate für flüssige Bewegungen
-FOURCC = cv2.VideoWriter_fourcc(*'mp4v') # Codec für Videoausgabe (wird für FFmpeg benötigt)
+FOURCC = "mp4v" # Codec für Videoausgabe (wird für FFmpeg benötigt)
 SAMPLERATE = 44100  # Abtastrate für Audio
 CHANNELS = 2        # Kanäle (Stereo)
-# ERHÖHT: Größere Blockgröße gibt dem Audiotreiber mehr Puffer, um Diskontinuitäten bei langen Aufnahmen zu vermeiden.
-BLOCKSIZE_MS = 250  # Audio-Blockgröße in Millisekunden (optimiert von 100 auf 250) 
+# Kleine Blöcke für geringe Latenz: Aussetzer des Treibers werden über den Ringpuffer erkannt und mit Stille aufgefüllt,
+# statt sie wie früher mit großen Blöcken (250 ms) zu überdecken.
+BLOCKSIZE_MS = 20  # Audio-Blockgröße in Millisekunden
+AUDIO_RING_SECONDS = 10 # Kapazität des Ringpuffers zwischen Audioaufnahme und Datei bzw. FFmpeg
+AUDIO_GAP_THRESHOLD_MS = 50 # Fehlen dauerhaft mehr Samples, als seit dem Start vergangen sind, wird Stille eingefügt (0 = aus)
+AUDIO_GAP_WINDOW_MS = 500 # So lange muss ein Fehlbestand mindestens anhalten, damit er als Aussetzer gilt
+AUDIO_SUBTYPE = "PCM_16" # Sample-Format der Audiodatei: "PCM_16" (klein) oder "FLOAT" (verlustfrei)
+AUDIO_FLUSH_SECONDS = 5 # Abstand, in dem die Audiodatei auf die Festplatte geschrieben wird
+# Skalierte Aufnahme: Der Ausschnitt wird direkt nach dem Screenshot auf die Ausgabegröße verkleinert (INTER_AREA),
+# so dass Konvertierung, Zwischendatei und Kodierung nur noch mit der Ausgabegröße arbeiten
+OUTPUT_SIZE = None # Ausgabegröße (Breite, Höhe), z.B. (1280, 720); None = Größe des Aufnahmebereichs
+CROP = None # Ausschnitt (x, y, Breite, Höhe) relativ zum Aufnahmebereich; None = ganzer Bereich
+# Pipeline: Aufnahme -> Konvertierung -> Kodierung laufen in eigenen Threads, verbunden über begrenzte Warteschlangen.
+QUEUE_SIZE = 8 # Maximale Anzahl Frames je Warteschlange
+QUEUE_FULL_POLICY = "block" # Verhalten bei voller Warteschlange: "block", "drop_oldest" oder "drop_newest"
+# Aufnahmemodus: "avi" schreibt eine Zwischendatei und kodiert nach dem Stopp, 
+# "stream" kodiert live über eine FFmpeg-Pipe (kein temporäres AVI, kein zweiter Kodierdurchlauf),
+# "segmented" schreibt eine absturzsichere Sitzung aus rollierenden Abschnitten (siehe finalize_session),
+# "replay" hält nur die letzten REPLAY_SECONDS im Arbeitsspeicher und speichert sie auf Abruf als Clip
+RECORDING_MODE = "avi"
+RECORDING_MODES = ("avi", "stream", "segmented", "replay")
+SESSION_PREFIX = "aufnahme_sitzung" # Verzeichnisname einer Sitzung (ergänzt um Datum und Uhrzeit)
+SEGMENT_SECONDS = 60 # Länge eines Aufnahmeabschnitts im Modus "segmented"
+JOURNAL_FLUSH_SECONDS = 2 # Abstand, in dem das Zeitstempel-Protokoll auf die Festplatte geschrieben wird
+TIMESTAMP_BLOCK_FRAMES = 256 # Zeitstempel werden in Blöcken dieser Größe an das Protokoll angehängt
+# Zusammenführen später erledigen: Die Aufnahme wird nur abgelegt und MuxQueue.py im Hintergrund gestartet,
+# so dass sofort eine neue Aufnahme beginnen kann (gilt für die Modi "avi" und "segmented")
+DEFER_FINALIZE = False
+REPLAY_SECONDS = 60 # Länge des Clips im Modus "replay"
+REPLAY_MEMORY_MB = 512 # Harte Obergrenze für den Replay-Puffer (JPEG-Frames und Audio); ältere Frames fallen vorher heraus
+REPLAY_JPEG_QUALITY = 85 # JPEG-Qualität der Frames im Replay-Puffer
+REPLAY_FILENAME = "clip.mp4" # Standardname gespeicherter Clips
+# Synchronisation beim Muxing: "average" streckt das Video auf eine gemittelte Framerate,
+# "timestamps" platziert jeden Frame anhand seines eigenen Aufnahmezeitpunkts (kein Drift bei Hängern)
+SYNC_MODE = "timestamps"
+# Unveränderte Frames (z.B. statische Dokumente) werden nicht erneut konvertiert, sondern als Wiederholung des letzten Frames geschrieben
+DUPLICATE_DETECTION = True
+# Taktgeber: Frame N wird zum Zeitpunkt Start + N/FPS aufgenommen (monotone Uhr, kein Aufsummieren von Schlafungenauigkeiten)
+MISSED_FRAME_POLICY = "skip" # Verpasster Termin: "skip" überspringt verpasste Frames, "catchup" holt sie sofort mit ihrem Termin als Zeitstempel nach
+SCHEDULER_SPIN_MS = 1.5 # Die letzten Millisekunden vor einem Termin wird aktiv gewartet statt geschlafen
+# Mehrere Bereiche (MultiRegionRecorder): "monitor" nimmt je Monitor einen Screenshot über die darauf liegenden Bereiche auf,
+# "union" einen einzigen über die umschließende Box aller Bereiche
+CAPTURE_GROUPING = "monitor"
+CAPTURE_GROUPINGS = ("monitor", "union")
+# Adaptive Regelung: Bei anhaltender Überlast wird die Aufnahmerate schrittweise gesenkt (FPS geteilt durch die
+# Teiler unten) und bei geringer Last wieder angehoben. Da Frames anhand ihrer Zeitstempel im Raster von 1/FPS liegen,
+# bleibt die Ausgabe bei FPS: Jeder Frame erscheint in seinem eigenen Zeitschlitz und steht bis zum nächsten,
+# statt zufällig zu ruckeln (siehe FrameSlotter). Nur mit SYNC_MODE = "timestamps" bzw. im Modus "stream" aktiv.
+ADAPTIVE_CONTROL = True
+ADAPTIVE_FPS_DIVISORS = (1, 2, 3) # Stufen der Aufnahmerate: FPS/1, FPS/2, FPS/3
+ADAPTIVE_WINDOW_SECONDS = 2.0 # Länge eines Messfensters
+ADAPTIVE_HIGH_LOAD = 0.85 # Auslastung einer Stufe (Aufnahme, Konvertierung, Kodierung), ab der ein Fenster als überlastet gilt
+ADAPTIVE_LOW_LOAD = 0.5 # Auf die nächsthöhere Rate hochgerechnete Auslastung, unter der wieder hochgeschaltet wird
+ADAPTIVE_STEP_DOWN_WINDOWS = 2 # So viele überlastete Fenster in Folge senken die Rate
+ADAPTIVE_STEP_UP_WINDOWS = 5 # So viele entspannte Fenster in Folge heben die Rate wieder an
+# Telemetrie: Laufzeit-Histogramme je Stufe, Warteschlangen, Verluste, A/V-Drift und FFmpeg-Geschwindigkeit.
+# Eine Zusammenfassung wird nach jeder Aufnahme ausgegeben; zusätzlich wird periodisch als JSON-Zeilen ("jsonl")
+# oder als Prometheus-Textdatei ("prometheus") neben die Ausgabedatei exportiert (None = kein Export)
+TELEMETRY_FORMAT = None
+TELEMETRY_INTERVAL_SECONDS = 5 # Abstand der Exporte
+TELEMETRY_FILENAME = "telemetrie" # Ergibt z.B. output_telemetrie.jsonl bzw. output_telemetrie.prom
+X264_CRF = "23" # Qualitätsstufe für libx264
+X264_PRESET = "veryfast" # Geschwindigkeitsstufe für libx264
+# Paralleles Kodieren nach dem Stopp: Das AVI wird in Abschnitte dieser Länge (Sekunden) geteilt,
+# die gleichzeitig kodiert und ohne erneute Kodierung zusammengefügt werden (0 = ein einziger Durchlauf)
+PARALLEL_SEGMENT_SECONDS = 60
+ENCODE_WORKERS = 0 # Anzahl gleichzeitiger FFmpeg-Prozesse (0 = Anzahl der CPU-Kerne)
 
 # Die manuelle Korrektur des Audio-Video-Drifts (AUDIO_SYNC_OFFSET_S) ist nicht mehr nötig.
 
-# Globale Variablen zur Steuerung der Threads
-stop_recording = threading.Event()
-# Wir verwenden eine Barrier, um Video- und Audio-Thread gleichzeitig zu starten (2 Teilnehmer)
-start_barrier = threading.Barrier(2) 
-video_out = None
-monitor_area = None
+# Globale Variablen der GUI (der Aufnahmezustand selbst liegt in der jeweiligen Recorder-Instanz)
 root_window = None
+gui_recorder = None # Über die GUI gestartete Aufnahme
+gui_recorder_options = {} # Einstellungen aus der Kommandozeile für die GUI-Aufnahme
+
+# Markiert das Ende des Datenstroms in einer Warteschlange
+_END_OF_STREAM = object()
+
+# --- ZEITBASIS ---
+
+def clock():
+    """
+    Gemeinsame Uhr für alle Video- und Audio-Zeitstempel (Sekunden).
+    Monoton und hochauflösend, NTP-Korrekturen der Systemzeit verschieben sie nicht.
+    """
+    return time.perf_counter()
+
+# --- ZEITSTEMPEL-PROTOKOLL ---
+
+# Kopf der Binärdatei: Kennung, FPS, Sync-Modus, Audio-Startzeit (ns), abgeschlossen (0/1); danach ein int64 (ns) je Frame
+TIMESTAMP_HEADER = struct.Struct("<8sd16sqq")
+TIMESTAMP_MAGIC = b"VRTSLOG1"
+_NO_TIMESTAMP = -(2 ** 63) # Platzhalter im Kopf, solange die Audio-Startzeit unbekannt ist
+
+class TimestampLog:
+    """
+    Hängt die Zeitstempel der Frames als int64-Nanosekunden an eine Binärdatei an (Aufbau siehe TIMESTAMP_HEADER).
+    Gesammelt wird in einem festen NumPy-Block, der beim Füllen oder spätestens nach flush_seconds
+    geschrieben wird. Der Speicherbedarf hängt daher nicht von der Aufnahmedauer ab, und nach einem
+    Absturz fehlen höchstens die letzten Sekunden. Erst close() markiert das Protokoll als abgeschlossen.
+    """
+
+    def __init__(self, path, fps=FPS, sync_mode=SYNC_MODE, block_frames=TIMESTAMP_BLOCK_FRAMES,
+                 flush_seconds=JOURNAL_FLUSH_SECONDS):
+        self.path = path
+        self.fps = fps
+        self.sync_mode = sync_mode
+        self.count = 0 # Anzahl bisher angehängter Zeitstempel
+        self._block = np.empty(block_frames, dtype="<i8")
+        self._filled = 0
+        self._flush_seconds = flush_seconds
+        self._file = open(path, 'wb')
+        self._write_header(None, complete=False)
+        self._last_flush = clock()
+
+    def _write_header(self, audio_start, complete):
+        audio_start_ns = _NO_TIMESTAMP if audio_start is None else round(audio_start * 1e9)
+        self._file.seek(0)
+        self._file.write(TIMESTAMP_HEADER.pack(TIMESTAMP_MAGIC, self.fps, self.sync_mode.encode("ascii"),
+                                               audio_start_ns, int(complete)))
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, timestamp):
+        self._block[self._filled] = round(timestamp * 1e9)
+        self._filled += 1
+        self.count += 1
+        if self._filled == len(self._block) or clock() - self._last_flush >= self._flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self._filled:
+            self._file.write(memoryview(self._block[:self._filled]))
+            self._filled = 0
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_flush = clock()
+
+    def close(self, audio_start=None):
+        """Schreibt die restlichen Zeitstempel und trägt Audio-Startzeit und Abschluss in den Kopf ein."""
+        if self._file.closed:
+            return
+        self.flush()
+        self._write_header(audio_start, complete=True)
+        self._file.close()
+
+
+def read_timestamp_log_header(path):
+    """Liest nur den Kopf eines Zeitstempel-Protokolls. Gibt ein dict mit fps, sync_mode, audio_start und complete zurück."""
+    with open(path, 'rb') as f:
+        return _parse_timestamp_header(f.read(TIMESTAMP_HEADER.size), path)
+
+def _parse_timestamp_header(data, path):
+    if len(data) < TIMESTAMP_HEADER.size or not data.startswith(TIMESTAMP_MAGIC):
+        raise ValueError(f"'{path}' ist kein Zeitstempel-Protokoll")
+    _, fps, sync_mode, audio_start_ns, complete = TIMESTAMP_HEADER.unpack(data)
+    return {
+        "fps": fps,
+        "sync_mode": sync_mode.rstrip(b"\0").decode("ascii"),
+        "audio_start": None if audio_start_ns == _NO_TIMESTAMP else audio_start_ns / 1e9,
+        "complete": bool(complete),
+    }
+
+def read_timestamp_log(path):
+    """
+    Liest ein Zeitstempel-Protokoll in einem Stück. Gibt (Zeitstempel in Sekunden als float64-Array, Kopf) zurück.
+    Ein unvollständiger letzter Eintrag (Absturz beim Schreiben) wird ignoriert.
+    """
+    with open(path, 'rb') as f:
+        header = _parse_timestamp_header(f.read(TIMESTAMP_HEADER.size), path)
+        count = (os.fstat(f.fileno()).st_size - TIMESTAMP_HEADER.size) // 8
+        nanoseconds = np.fromfile(f, dtype="<i8", count=count)
+    return nanoseconds / 1e9, header
+
+def load_timestamps(timestamp_path):
+    """
+    Lädt die Zeitstempel einer Aufnahme. Gibt (Frame-Zeitstempel als Array, Audio-Startzeit) zurück.
+    Ältere JSON-Dateien enthalten nur die Liste der Frame-Zeitstempel, dann ist die Audio-Startzeit None.
+    """
+    if not timestamp_path.endswith(".json"):
+        timestamps, header = read_timestamp_log(timestamp_path)
+        return timestamps, header["audio_start"]
+    with open(timestamp_path, 'r') as f:
+        return np.asarray(json.load(f), dtype=np.float64), None
+
+def timestamp_statistics(timestamps, fps=FPS):
+    """Kennzahlen der Frame-Abstände (vektorisiert), z.B. für TimestampStats.py."""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) < 2:
+        return {"frames": len(timestamps)}
+    intervals = np.diff(timestamps)
+    duration = timestamps[-1] - timestamps[0]
+    # Abstände über 1,5 Rasterschritte: dazwischen fehlt mindestens ein Frame
+    gaps = intervals > 1.5 / fps
+    return {
+        "frames": len(timestamps),
+        "duration": float(duration),
+        "achieved_fps": (len(timestamps) - 1) / duration if duration > 0 else 0.0,
+        "interval_mean_ms": float(intervals.mean() * 1000),
+        "jitter_ms": float(intervals.std() * 1000),
+        "interval_p50_ms": float(np.percentile(intervals, 50) * 1000),
+        "interval_p95_ms": float(np.percentile(intervals, 95) * 1000),
+        "interval_p99_ms": float(np.percentile(intervals, 99) * 1000),
+        "interval_max_ms": float(intervals.max() * 1000),
+        "gaps": int(gaps.sum()),
+        "missing_frames": int(np.maximum(np.rint(intervals[gaps] * fps) - 1, 0).sum()),
+        "non_monotonic": int((intervals <= 0).sum()),
+        "max_average_rate_offset_ms": max_average_rate_offset(timestamps, (len(timestamps) - 1) / duration) * 1000
+                                      if duration > 0 else 0.0,
+    }
+
+def write_json_atomic(path, data):
+    """Schreibt JSON atomar (erst temporär, dann umbenennen), damit die Datei nie halb geschrieben ist."""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def load_recording_meta(stem):
+    """
+    Angaben zu den Zwischendateien stem_aufnahme.avi usw., z.B. die gewählte Ausgabedatei ("output").
+    Aufnahmen ohne diese Datei (ältere Versionen) ergeben ein leeres Dictionary.
+    """
+    try:
+        with open(f"{stem}_{RECORDING_META_FILENAME}", 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def remove_recording_meta(stem):
+    try:
+        os.remove(f"{stem}_{RECORDING_META_FILENAME}")
+    except FileNotFoundError:
+        pass
 
 # --- FFmpeg MUXING FUNKTION ---
 
-def mux_files_with_ffmpeg(video_path, audio_path, output_path, timestamp_path):
-    """Führt Video und Audio mit FFmpeg zusammen unter Berücksichtigung der Zeitstempel."""
+def max_average_rate_offset(timestamps, average_fps):
+    """Größte Abweichung (Sekunden) zwischen echtem Aufnahmezeitpunkt und der Position bei gemittelter Framerate."""
+    times = np.asarray(timestamps, dtype=np.float64)
+    times = times - times[0]
+    positions = np.arange(len(times)) / average_fps
+    return float(np.max(np.abs(times - positions)))
+
+def read_ffmpeg_progress(stream, on_progress):
+    """Liest die Ausgabe von '-progress' (Zeilen Schlüssel=Wert, jeder Block endet mit 'progress=') und meldet jeden Block."""
+    block = {}
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode(errors="replace")
+        key, separator, value = line.strip().partition("=")
+        if not separator:
+            continue
+        block[key] = value
+        if key == "progress":
+            on_progress(block)
+            block = {}
+
+def ffmpeg_speed(progress):
+    """Kodiergeschwindigkeit eines Fortschrittsblocks als Vielfaches der Echtzeit (None, solange FFmpeg 'N/A' meldet)."""
+    try:
+        return float(progress.get("speed", "").rstrip("x"))
+    except ValueError:
+        return None
+
+def partial_output_path(output_path):
+    """Pfad, in den FFmpeg schreibt; erst die fertige Datei wird per os.replace unter output_path sichtbar."""
+    name, ext = os.path.splitext(output_path)
+    return f"{name}.part{ext}"
+
+def run_ffmpeg(command, on_progress=None):
+    """
+    Wie subprocess.run(command, check=True, capture_output=True, text=True), meldet aber
+    den Fortschritt von FFmpeg laufend an on_progress(block), sofern angegeben.
+    """
+    if on_progress is None:
+        return subprocess.run(command, check=True, capture_output=True, text=True)
+    command = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    stderr_lines = []
+    # stderr parallel leeren, sonst blockiert FFmpeg bei vollem Puffer
+    stderr_thread = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), name="ffmpeg-stderr", daemon=True)
+    stderr_thread.start()
+    read_ffmpeg_progress(process.stdout, on_progress)
+    returncode = process.wait()
+    stderr_thread.join()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output="", stderr="".join(stderr_lines))
+    return subprocess.CompletedProcess(command, returncode, "", "".join(stderr_lines))
+
+def start_offset_args(start_offset, audio_input_args):
+    """
+    Gibt (Optionen vor dem Video-Input, Audio-Input) für den Versatz erster Frame zu erstem Sample zurück.
+    Ein positiver Versatz verschiebt das Video, ein negativer das Audio per -itsoffset.
+    """
+    if start_offset > 0:
+        return ["-itsoffset", f"{start_offset:.6f}"], audio_input_args
+    if start_offset < 0:
+        return [], ["-itsoffset", f"{-start_offset:.6f}", *audio_input_args]
+    return [], audio_input_args
+
+def mux_files_with_ffmpeg(video_path, audio_path, output_path, timestamp_path, fps=FPS, sync_mode=SYNC_MODE,
+                          on_progress=None):
+    """
+    Führt Video und Audio mit FFmpeg zusammen unter Berücksichtigung der Zeitstempel. Gibt True bei Erfolg zurück.
+    on_progress erhält laufend die Fortschrittsmeldungen von FFmpeg (siehe run_ffmpeg).
+    """
     
     # Prüfen, ob temporäre Dateien existieren
     if not os.path.exists(video_path) or not os.path.exists(audio_path) or not os.path.exists(timestamp_path):
         print("FEHLER: Eine oder mehrere Quelldateien (Video, Audio oder Zeitstempel) fehlen für das Muxing.", file=sys.stderr)
-        return
+        return False
     
     # 1. Zeitstempel laden
     try:
-        with open(timestamp_path, 'r') as f:
-            timestamps = json.load(f)
+        timestamps, audio_start = load_timestamps(timestamp_path)
     except Exception as e:
         print(f"FEHLER: Konnte Zeitstempel nicht laden: {e}", file=sys.stderr)
-        return
+        return False
 
-    if not timestamps:
+    if len(timestamps) == 0:
         print("FEHLER: Keine Zeitstempel gefunden, kann nicht synchronisieren.", file=sys.stderr)
-        return
+        return False
         
     # 2. Start-Offset berechnen (Differenz zwischen dem allerersten Video-Frame und der Audio-Aufnahme)
     # Da die Barriere fast gleichzeitig startet, ist der erste Zeitstempel des Videos der beste Anhaltspunkt.
@@ -76,32 +395,64 @@ def mux_files_with_ffmpeg(video_path, audio_path, output_path, timestamp_path):
     # Berechne die "korrigierte" Framerate (fps) für FFmpeg
     # Diese korrigierte Rate sorgt dafür, dass die Gesamtdauer des Videos der tatsächlichen Aufnahmezeit entspricht
     corrected_fps = len(timestamps) / video_duration
+
+    video_offset_args = []
+    audio_input_args = ["-i", audio_path]
+    if sync_mode == "timestamps":
+        # Das AVI wurde bereits zeitstempelgenau im Raster von 1/FPS geschrieben (siehe FrameSlotter),
+        # daher wird es mit der nominalen Rate gelesen statt mit einer gemittelten.
+        input_fps = fps
+        max_offset = max_average_rate_offset(timestamps, corrected_fps)
+        print(f"\nStarte Zusammenführung (Muxing) mit Zeitstempel-Synchronisation ({fps} FPS Raster)...")
+        print(f"Maximal korrigierte A/V-Abweichung gegenüber gemittelter Rate: {max_offset * 1000:.1f} ms "
+              f"(Restfehler höchstens {500.0 / fps:.1f} ms)")
+        if audio_start is not None:
+            # Der später beginnende Input wird um die Differenz verschoben: meist das Video,
+            # bei negativem Versatz (erster Frame vor dem ersten Sample) das Audio
+            start_offset = timestamps[0] - audio_start
+            print(f"Start-Versatz Video zu Audio: {start_offset * 1000:.1f} ms")
+            video_offset_args, audio_input_args = start_offset_args(start_offset, audio_input_args)
+    else:
+        input_fps = corrected_fps
+        print(f"\nStarte Zusammenführung (Muxing) mit korrigierter Rate von {corrected_fps:.2f} FPS...")
     
-    print(f"\nStarte Zusammenführung (Muxing) mit korrigierter Rate von {corrected_fps:.2f} FPS...")
-    
+    # FFmpeg schreibt zunächst in eine .part-Datei, damit unter output_path nie eine halbe Datei liegt
+    partial_path = partial_output_path(output_path)
+
     # FFmpeg-Befehl: 
-    # NEU: -r {corrected_fps} wendet die korrigierte Framerate auf den Input 0 (Video) an.
+    # -r {input_fps} wendet die (nominale oder korrigierte) Framerate auf den Input 0 (Video) an.
     command = [
         "ffmpeg",
-        "-r", f"{corrected_fps}", # Korrigierte Rate für den Video-Input
+        *video_offset_args,
+        "-r", f"{input_fps}", # Rate für den Video-Input
         "-i", video_path,
-        "-i", audio_path,
+        *audio_input_args,
         "-map", "0:v:0", # Nimm den ersten Videostream von Input 0
         "-map", "1:a:0", # Nimm den ersten Audiostream von Input 1
         "-c:v", "libx264",
-        "-crf", "23", 
-        "-preset", "veryfast", 
+        "-crf", X264_CRF, 
+        "-preset", X264_PRESET, 
         "-c:a", "aac",
         "-b:a", "192k",
         "-pix_fmt", "yuv420p",
         "-shortest", # Beendet die Codierung, sobald der kürzeste Input Stream endet
         "-y", # Überschreibt die Ausgabedatei ohne Nachfrage
-        output_path
+        partial_path
     ]
     
+    segment_dir = os.path.splitext(output_path)[0] + "_segmente"
     try:
+        os.makedirs(segment_dir, exist_ok=True)
+        segment_paths = encode_segments_parallel(video_path, input_fps, segment_dir, PARALLEL_SEGMENT_SECONDS, ENCODE_WORKERS, fps)
+        if segment_paths:
+            # Abschnitte ohne erneute Kodierung aneinanderhängen, nur das Audio wird noch kodiert
+            list_path = os.path.join(segment_dir, "segmente.ffconcat")
+            write_concat_list(list_path, segment_paths)
+            command = build_concat_mux_command(list_path, audio_input_args, partial_path, video_offset_args)
+
         # Ausführen des FFmpeg-Befehls
-        process = subprocess.run(command, check=True, capture_output=True, text=True)
+        process = run_ffmpeg(command, on_progress)
+        os.replace(partial_path, output_path)
         print(f"Erfolgreich zu {output_path} gemuxt und kodiert.")
         
         # Temporäre Dateien aufräumen
@@ -109,159 +460,2148 @@ def mux_files_with_ffmpeg(video_path, audio_path, output_path, timestamp_path):
         os.remove(audio_path)
         os.remove(timestamp_path)
         print(f"Temporäre Dateien ({video_path}, {audio_path} und {timestamp_path}) gelöscht.")
+        return True
         
     except subprocess.CalledProcessError as e:
         print(f"FEHLER: FFmpeg-Befehl fehlgeschlagen. Ist FFmpeg installiert und im PATH?", file=sys.stderr)
-        print(f"Befehl: {' '.join(command)}", file=sys.stderr)
+        print(f"Befehl: {' '.join(e.cmd)}", file=sys.stderr)
         print(f"Fehlermeldung (stdout): {e.stdout}", file=sys.stderr)
         print(f"Fehlermeldung (stderr): {e.stderr}", file=sys.stderr)
+        return False
     except FileNotFoundError:
         print("FEHLER: FFmpeg-Programm wurde nicht gefunden. Bitte stellen Sie sicher, dass FFmpeg installiert und in Ihrem System-PATH ist.", file=sys.stderr)
+        return False
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
 
-# --- SOUNDCARD LOOPBACK LOGIK ---
+def count_video_frames(video_path):
+    """Liest die Anzahl der Frames aus dem Index der AVI-Datei."""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        return int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        capture.release()
 
-def find_loopback_device(speaker_name):
+def encode_segment(video_path, segment_path, first_frame, frame_count, input_fps, container_fps=FPS, threads=1):
     """
-    Sucht das korrespondierende Loopback-Aufnahmegerät basierend auf dem Namen des Standard-Ausgabegeräts.
-    Gibt ein Microphone-Objekt (das als Loopback-Quelle dient) oder None zurück.
+    Kodiert die Frames [first_frame, first_frame + frame_count) des AVIs als eigenständige H.264-Datei.
+    Mit frame_count None wird bis zum Ende der Datei kodiert.
     """
-    all_mics = sc.all_microphones(include_loopback=True)
-    speaker_name_lower = speaker_name.strip().lower()
-    
-    # Suchen Sie nach dem Gerät, dessen Name dem Speaker-Namen entspricht oder 'Monitor'/'Mix' enthält.
-    for mic in all_mics:
-        mic_name_lower = mic.name.strip().lower()
-        
-        # Exakter Match oder ein Monitor/Mix-Gerät, das den Namen enthält
-        if mic_name_lower == speaker_name_lower or \
-           (speaker_name_lower in mic_name_lower and ('monitor' in mic_name_lower or 'mix' in mic_name_lower)):
-             return mic 
-             
-    # Falls soundcard keine klare Loopback-Quelle als 'Microphone' erkennt, 
-    # kann die Aufnahme trotzdem fehlschlagen.
-    return None
+    # Das AVI wurde mit container_fps geschrieben, Frame k liegt bei k/container_fps. Eine halbe Frame-Dauer
+    # früher zu suchen macht den Schnitt trotz Rundung framegenau (FFmpeg verwirft alles vor -ss).
+    seek = max(0.0, (first_frame - 0.5) / container_fps)
+    frame_limit = ["-frames:v", f"{frame_count}"] if frame_count is not None else []
+    command = [
+        "ffmpeg",
+        "-ss", f"{seek:.6f}",
+        "-i", video_path,
+        *frame_limit,
+        # Zeitstempel im Abschnitt neu ab 0 vergeben, mit derselben Rate wie beim Gesamtdurchlauf
+        "-vf", f"setpts=N/({input_fps}*TB)",
+        "-r", f"{input_fps}",
+        "-c:v", "libx264",
+        "-crf", X264_CRF,
+        "-preset", X264_PRESET,
+        "-pix_fmt", "yuv420p",
+        "-threads", f"{threads}",
+        "-an",
+        "-y",
+        segment_path
+    ]
+    subprocess.run(command, check=True, capture_output=True, text=True)
+    return segment_path
 
-# --- AUDIO AUFNAHME FUNKTION ---
+def encode_segments_parallel(video_path, input_fps, segment_dir, segment_seconds=PARALLEL_SEGMENT_SECONDS, workers=ENCODE_WORKERS,
+                             container_fps=FPS):
+    """
+    Teilt das AVI in Abschnitte und kodiert sie gleichzeitig. Gibt die Pfade der kodierten
+    Abschnitte in Abspielreihenfolge zurück, oder None, wenn sich das Teilen nicht lohnt.
+    Die eigentliche Arbeit erledigen die FFmpeg-Prozesse, daher genügt ein Thread je Prozess.
+    """
+    total_frames = count_video_frames(video_path)
+    segment_frames = max(1, int(segment_seconds * container_fps))
+    if segment_seconds <= 0 or total_frames <= segment_frames:
+        return None
 
-def record_audio():
-    """Nimmt System-Audio über WASAPI Loopback auf (ersetzt sounddevice-Logik)."""
-    
-    # Warten auf das Startsignal des GUI-Threads, um Synchronisation zu gewährleisten
-    start_barrier.wait() 
-    
+    jobs = [
+        (video_path, os.path.join(segment_dir, f"segment_{index:05d}.mp4"),
+         first_frame, min(segment_frames, total_frames - first_frame), input_fps, container_fps)
+        for index, first_frame in enumerate(range(0, total_frames, segment_frames))
+    ]
+    print(f"Kodiere {len(jobs)} Abschnitte à {segment_seconds} s parallel...")
+    return run_encode_jobs(jobs, workers)
+
+def run_encode_jobs(jobs, workers=ENCODE_WORKERS):
+    """
+    Führt encode_segment-Aufträge (Argument-Tupel) gleichzeitig aus und gibt die Ausgabepfade
+    in Auftragsreihenfolge zurück. Die Kerne werden auf die FFmpeg-Prozesse aufgeteilt.
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(jobs)))
+    threads_per_process = max(1, cores // workers)
+    print(f"Starte {len(jobs)} Kodieraufträge mit {workers} parallelen FFmpeg-Prozessen...")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(encode_segment, *job, threads=threads_per_process) for job in jobs]
+        return [future.result() for future in futures]
+
+def build_concat_mux_command(video_list_path, audio_input_args, output_path, video_offset_args=()):
+    """FFmpeg-Befehl, der kodierte Abschnitte ohne erneute Kodierung aneinanderhängt und das Audio hinzufügt."""
+    return [
+        "ffmpeg",
+        *video_offset_args,
+        "-f", "concat",
+        "-safe", "0",
+        "-i", video_list_path,
+        *audio_input_args,
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-b:a", "192k",
+        "-shortest",
+        "-y",
+        output_path
+    ]
+
+def write_concat_list(list_path, segment_paths):
+    """Schreibt die Eingabeliste für den concat-Demuxer von FFmpeg."""
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write("ffconcat version 1.0\n")
+        for segment_path in segment_paths:
+            escaped = os.path.abspath(segment_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+# --- SEGMENTIERTE SITZUNGEN (Modus "segmented") ---
+
+SESSION_META_FILENAME = "session.json"
+
+def segment_path(session_dir, kind, index, extension):
+    """Pfad eines Abschnitts, z.B. video_00003.avi oder audio_00003.wav."""
+    return os.path.join(session_dir, f"{kind}_{index:05d}{extension}")
+
+def write_session_meta(session_dir, meta):
+    """Schreibt die Sitzungsdaten atomar, damit sie nie halb geschrieben sind."""
+    write_json_atomic(os.path.join(session_dir, SESSION_META_FILENAME), meta)
+
+def load_session_meta(session_dir):
+    with open(os.path.join(session_dir, SESSION_META_FILENAME), 'r') as f:
+        return json.load(f)
+
+def update_session_meta(session_dir, **values):
+    meta = load_session_meta(session_dir)
+    meta.update(values)
+    write_session_meta(session_dir, meta)
+
+def create_session_dir(width, height, fps=FPS, sync_mode=SYNC_MODE, output_path=None):
+    """Legt das Verzeichnis einer neuen Sitzung an und speichert die Aufnahmeeinstellungen darin."""
+    base = f"{SESSION_PREFIX}_{time.strftime('%Y%m%d_%H%M%S')}"
+    session_dir = base
+    counter = 1
+    while True:
+        try:
+            os.makedirs(session_dir)
+            break
+        except FileExistsError:
+            session_dir = f"{base}_{counter}"
+            counter += 1
+    write_session_meta(session_dir, {
+        "fps": fps,
+        "sync_mode": sync_mode,
+        "width": width,
+        "height": height,
+        "samplerate": SAMPLERATE,
+        "channels": CHANNELS,
+        "segment_seconds": SEGMENT_SECONDS,
+        "audio_start": None,
+        # Ziel der Sitzung und ob die Aufnahme regulär beendet wurde (für MuxQueue.py)
+        "output": os.path.abspath(output_path) if output_path else None,
+        "complete": False,
+    })
+    return session_dir
+
+
+def segment_input_rates(journals, sync_mode, fps):
+    """
+    Bestimmt die Lese-Framerate je Abschnitt. Bei "timestamps" liegen die Frames bereits im Raster
+    von 1/FPS. Bei "average" wird jeder Abschnitt auf die Zeit bis zum ersten Frame des nächsten
+    Abschnitts gestreckt, damit die Synchronisation über Abschnittsgrenzen hinweg erhalten bleibt.
+    """
+    if sync_mode == "timestamps":
+        return [fps] * len(journals)
+    rates = []
+    for index, timestamps in enumerate(journals):
+        if index + 1 < len(journals):
+            duration = journals[index + 1][0] - timestamps[0]
+        elif len(timestamps) > 1:
+            # Letzter Abschnitt: Dauer des letzten Frames mit dem mittleren Abstand abschätzen
+            duration = (timestamps[-1] - timestamps[0]) * len(timestamps) / (len(timestamps) - 1)
+        else:
+            duration = 1.0 / fps
+        rates.append(len(timestamps) / duration if duration > 0 else fps)
+    return rates
+
+
+def finalize_session(session_dir, output_path, on_progress=None):
+    """
+    Erstellt die MP4 aus allen erhaltenen Abschnitten einer Sitzung, auch nach einem Absturz
+    während der Aufnahme. Die Videoabschnitte werden parallel kodiert und mit dem Audio
+    zusammengefügt. Gibt True bei Erfolg zurück; die Sitzung wird dann gelöscht.
+    """
     try:
-        # 1. Standard-Ausgabegerät erkennen
-        default_speaker = sc.default_speaker()
-        speaker_name = default_speaker.name
-        
-        # 2. Explizit nach dem Loopback-Mikrofon suchen
-        source_device = find_loopback_device(speaker_name)
-        
-        if source_device is None:
-            print(f"FEHLER: Loopback-Gerät für '{speaker_name}' konnte nicht gefunden werden.", file=sys.stderr)
-            print("Überprüfen Sie, ob 'Stereo Mix' oder eine virtuelle Loopback-Quelle aktiviert ist.", file=sys.stderr)
-            stop_recording.set()
-            return
-            
-        print(f"Verwende Loopback-Gerät: '{source_device.name}'. Aufnahme gestartet.")
-        
-        # Stream öffnen und Daten in Blöcken aufnehmen
-        samplerate = SAMPLERATE
-        channels = CHANNELS
-        audio_data_chunks = []
-        
-        # Blockgröße für die Aufnahme: (Bsp. 250ms)
-        blocksize = int(samplerate * (BLOCKSIZE_MS / 1000.0)) 
-
-        with source_device.recorder(samplerate=samplerate, channels=channels, blocksize=blocksize) as mic_recorder:
-            
-            while not stop_recording.is_set():
-                # Datenblock aus dem Stream lesen (blockiert, bis der Block gefüllt ist)
-                data = mic_recorder.record()
-                audio_data_chunks.append(data.copy())
-                # Keine manuelle Pause hier, da mic_recorder.record() die Zeitsteuerung übernimmt
-                
+        meta = load_session_meta(session_dir)
     except Exception as e:
-        print(f"Fehler bei der Audioaufnahme: {e}", file=sys.stderr)
-        stop_recording.set()
-        return
-
-    print("\nAudioaufnahme wird gespeichert...")
-    if audio_data_chunks:
-        audio_array = np.concatenate(audio_data_chunks, axis=0)
-        sf.write(AUDIO_FILENAME, audio_array, samplerate)
-        print(f"Audio unter {AUDIO_FILENAME} gespeichert.")
-    else:
-        print("Kein Audio aufgenommen.")
+        print(f"FEHLER: Sitzungsdaten in '{session_dir}' konnten nicht gelesen werden: {e}", file=sys.stderr)
+        return False
 
+    # Abschnitte ohne einen einzigen Zeitstempel (Absturz direkt nach dem Anlegen) werden übersprungen
+    video_segments = []
+    journals = []
+    index = 0
+    while os.path.exists(segment_path(session_dir, "video", index, ".avi")):
+        log_path = segment_path(session_dir, "timestamps", index, ".bin")
+        timestamps = read_timestamp_log(log_path)[0] if os.path.exists(log_path) else ()
+        if len(timestamps):
+            video_segments.append(segment_path(session_dir, "video", index, ".avi"))
+            journals.append(timestamps)
+        index += 1
+    audio_segments = []
+    while os.path.exists(segment_path(session_dir, "audio", len(audio_segments), ".wav")):
+        audio_segments.append(segment_path(session_dir, "audio", len(audio_segments), ".wav"))
 
-# --- VIDEO AUFNAHME FUNKTION ---
+    if not video_segments or not audio_segments:
+        print(f"FEHLER: In '{session_dir}' sind keine verwertbaren Video- oder Audioabschnitte vorhanden.", file=sys.stderr)
+        return False
 
-def record_video():
-    """Nimmt den angegebenen Bildschirmbereich auf und speichert jeden Frame mit Zeitstempel."""
-    global video_out
-    
-    timestamps = [] # Liste zur Speicherung der Zeitstempel
-    
-    # Warten auf das Startsignal des Audio-Threads, um Synchronisation zu gewährleisten
-    start_barrier.wait() 
-    
-    sct = mss.mss()
-    print("Videoaufnahme gestartet.")
-    
-    if monitor_area:
-        # WICHTIG: Verwende eine sehr hohe Framerate (z.B. 1000) für den AVI-Container, 
-        # damit FFmpeg die tatsächliche Frame-Dauer später neu berechnet. 
-        # Alternativ können wir die ursprüngliche FPS verwenden und später korrigieren.
-        # Wir bleiben bei der Ziel-FPS, lassen aber die Zeitsteuerung von FFmpeg korrigieren.
-        video_out = cv2.VideoWriter(VIDEO_FILENAME, FOURCC, FPS, (monitor_area['width'], monitor_area['height']))
-        
-    frame_duration = 1.0 / FPS # Zielzeit pro Frame (z.B. 1/30 = 0.0333s)
-    
-    while not stop_recording.is_set():
-        start_time = time.time()
-        
-        if not monitor_area:
-            time.sleep(0.1)
-            continue
-            
+    fps = meta["fps"]
+    rates = segment_input_rates(journals, meta["sync_mode"], fps)
+    print(f"\nFinalisiere Sitzung '{session_dir}': {len(video_segments)} Video- und {len(audio_segments)} Audioabschnitte...")
+
+    work_dir = os.path.join(session_dir, "finalize")
+    audio_list = os.path.join(work_dir, "audio.ffconcat")
+    video_offset_args = []
+    audio_input_args = ["-f", "concat", "-safe", "0", "-i", audio_list]
+    audio_start = meta.get("audio_start")
+    if audio_start is not None:
+        # Wie in mux_files_with_ffmpeg wird der später beginnende Input verschoben
+        start_offset = journals[0][0] - audio_start
+        print(f"Start-Versatz Video zu Audio: {start_offset * 1000:.1f} ms")
+        video_offset_args, audio_input_args = start_offset_args(start_offset, audio_input_args)
+
+    partial_path = partial_output_path(output_path)
+    try:
+        os.makedirs(work_dir, exist_ok=True)
+        # Jeder Abschnitt wird vollständig mit seiner eigenen Lese-Framerate kodiert
+        jobs = [
+            (video_path, os.path.join(work_dir, f"segment_{number:05d}.mp4"), 0, None, rate, fps)
+            for number, (video_path, rate) in enumerate(zip(video_segments, rates))
+        ]
+        encoded_segments = run_encode_jobs(jobs, ENCODE_WORKERS)
+        video_list = os.path.join(work_dir, "video.ffconcat")
+        write_concat_list(video_list, encoded_segments)
+        write_concat_list(audio_list, audio_segments)
+        command = build_concat_mux_command(video_list, audio_input_args, partial_path, video_offset_args)
+        run_ffmpeg(command, on_progress)
+        os.replace(partial_path, output_path)
+    except subprocess.CalledProcessError as e:
+        print("FEHLER: FFmpeg-Befehl beim Finalisieren fehlgeschlagen.", file=sys.stderr)
+        print(f"Befehl: {' '.join(e.cmd)}", file=sys.stderr)
+        print(f"Fehlermeldung (stderr): {e.stderr}", file=sys.stderr)
+        return False
+    except FileNotFoundError:
+        print("FEHLER: FFmpeg-Programm wurde nicht gefunden. Bitte stellen Sie sicher, dass FFmpeg installiert und in Ihrem System-PATH ist.", file=sys.stderr)
+        return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    print(f"Sitzung erfolgreich zu {output_path} zusammengeführt.")
+    # Falls das Löschen unvollständig bleibt, erkennt MuxQueue.py die Sitzung trotzdem als fertig
+    update_session_meta(session_dir, finished=True)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    print(f"Sitzungsverzeichnis {session_dir} gelöscht.")
+    return True
+
+# --- VIDEO AUSGABE (AVI-Zwischendatei oder FFmpeg-Live-Kodierung) ---
+
+class AviWriter:
+    """Schreibt Frames über cv2.VideoWriter in die temporäre AVI-Datei (Modus "avi")."""
+
+    pixel_format = "bgr" # cv2.VideoWriter erwartet Frames mit drei Kanälen
+
+    def __init__(self, path, width, height, fps=FPS, sync_mode=SYNC_MODE):
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCC), fps, (width, height))
+        # Bei "timestamps" bestimmt der Zeitstempel die Position jedes Frames im AVI,
+        # bei "average" korrigiert FFmpeg später nur die Gesamtdauer.
+        self.slotter = FrameSlotter(fps) if sync_mode == "timestamps" else None
+        self._previous = None # Zuletzt übergebener Frame, füllt Lücken vor dem nächsten
+
+    def write(self, frame, timestamp):
+        if self.slotter is None:
+            self._writer.write(frame)
+            return
+        repeats = self.slotter.repeats(timestamp)
+        for _ in range(repeats - 1):
+            self._writer.write(self._previous)
+        if repeats:
+            self._writer.write(frame)
+        self._previous = frame
+
+    def close(self):
+        self._writer.release()
+        return True
+
+
+class SegmentedAviWriter:
+    """
+    Schreibt die Aufnahme in rollierende AVI-Abschnitte fester Länge (Modus "segmented").
+    Zu jedem Abschnitt gehört ein Zeitstempel-Protokoll, das laufend auf die Festplatte geschrieben wird.
+    Bei einem Absturz gehen so höchstens der unvollständige letzte Abschnitt und wenige Sekunden verloren.
+    """
+
+    pixel_format = "bgr"
+
+    def __init__(self, session_dir, width, height, fps=FPS, sync_mode=SYNC_MODE, segment_seconds=SEGMENT_SECONDS):
+        self.session_dir = session_dir
+        self.frame_size = (width, height)
+        self.fps = fps
+        self.sync_mode = sync_mode
+        self.segment_frames = max(1, int(segment_seconds * fps))
+        # Wie bei AviWriter: Bei "timestamps" bestimmt der Zeitstempel die Position im Raster.
+        # Alle Abschnitte außer dem letzten enthalten dann exakt segment_frames Zeitschlitze.
+        self.slotter = FrameSlotter(fps) if sync_mode == "timestamps" else None
+        self.segment_index = -1
+        self.audio_start = None # Zeitpunkt des ersten Audio-Samples, wird in jedes Protokoll eingetragen
+        self._writer = None
+        self._journal = None
+        self._frames_in_segment = 0
+        self._previous = None # Zuletzt übergebener Frame, füllt Lücken vor dem nächsten
+        self._open_next_segment()
+
+    def _open_next_segment(self):
+        self._close_segment()
+        self.segment_index += 1
+        self._writer = cv2.VideoWriter(segment_path(self.session_dir, "video", self.segment_index, ".avi"),
+                                       cv2.VideoWriter_fourcc(*FOURCC), self.fps, self.frame_size)
+        self._journal = TimestampLog(segment_path(self.session_dir, "timestamps", self.segment_index, ".bin"),
+                                     self.fps, self.sync_mode)
+        self._frames_in_segment = 0
+
+    def _close_segment(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._journal.close(self.audio_start)
+
+    def write(self, frame, timestamp):
+        repeats = 1 if self.slotter is None else self.slotter.repeats(timestamp)
+        if repeats == 0:
+            self._previous = frame
+            return
+        for number in range(repeats):
+            if self._frames_in_segment >= self.segment_frames:
+                self._open_next_segment()
+            self._writer.write(frame if number == repeats - 1 else self._previous)
+            self._frames_in_segment += 1
+        self._previous = frame
+        self._journal.append(timestamp)
+
+    def close(self):
+        self._close_segment()
+        self._writer = None
+        return True
+
+
+class FrameSlotter:
+    """
+    Ordnet Frames anhand ihres Zeitstempels festen Zeitschlitzen von 1/FPS zu.
+    Fehlende Schlitze werden mit dem vorherigen Frame aufgefüllt, doppelt belegte verworfen,
+    so dass ein Datenstrom mit konstanter Rate trotzdem der realen Aufnahmezeit folgt.
+    Die Writer merken sich dazu den zuletzt übergebenen Frame: Bei repeats() == n schreiben sie
+    ihn n-1 mal und danach einmal den neuen Frame, der so erst in seinem eigenen Schlitz erscheint.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.start_time = None
+        self.slots_filled = 0
+        self.duplicated = 0 # Zusätzlich geschriebene Kopien (Lücken in der Aufnahme)
+        self.skipped = 0 # Verworfene Frames (mehrere Frames im selben Zeitschlitz)
+
+    def repeats(self, timestamp):
+        """Gibt die Anzahl der zu schreibenden Schlitze bis einschließlich dem des Frames zurück (0 = verwerfen)."""
+        if self.start_time is None:
+            self.start_time = timestamp
+        slot = int(round((timestamp - self.start_time) * self.fps))
+        if slot < self.slots_filled:
+            self.skipped += 1
+            return 0
+        count = slot - self.slots_filled + 1
+        self.duplicated += count - 1
+        self.slots_filled += count
+        return count
+
+
+class FfmpegStreamWriter:
+    """
+    Schreibt Frames als Rohdaten in die Standardeingabe eines laufenden FFmpeg-Prozesses.
+    Das Audio wird über eine lokale TCP-Verbindung als zweiter Input eingespeist,
+    damit die fertige MP4 wenige Sekunden nach dem Stopp vorliegt.
+    FFmpeg liest BGRA direkt, die Farbkonvertierung in Python entfällt dadurch komplett.
+    Beide Inputs beginnen bei PTS 0, daher wird das Audio vor dem Weiterleiten am ersten Frame
+    ausgerichtet (wie -itsoffset beim Muxing der AVI-Zwischendatei).
+    """
+
+    pixel_format = "bgra"
+
+    def __init__(self, output_path, width, height, fps=FPS, samplerate=SAMPLERATE, channels=CHANNELS):
+        self.output_path = output_path
+        self.frame_size = (width, height)
+        self.slotter = FrameSlotter(fps)
+        self._previous = None # Daten des zuletzt übergebenen Frames, füllen Lücken vor dem nächsten
+        self.samplerate = samplerate
+        self.channels = channels
+        self.audio_start = None # Zeitpunkt des ersten Audio-Samples, siehe set_audio_start
+        self.start_offset = None # Versatz erster Frame zu erstem Sample in Sekunden, sobald beide bekannt sind
+        self._pending_audio = [] # Audio, das bis zur Ausrichtung zurückgehalten wird (Kopien)
+        self._audio_skip = 0 # Noch zu verwerfende Samples vor dem ersten Frame
+        self._audio_lock = threading.Lock()
+        self._audio_conn = None
+        self._closed = False
+        self._stderr_tail = collections.deque(maxlen=20) # Letzte FFmpeg-Meldungen für Fehlerausgaben
+        self.speed = None # Kodiergeschwindigkeit laut FFmpeg (Vielfaches der Echtzeit, unter 1 fällt FFmpeg zurück)
+
+        # FFmpeg verbindet sich als Client mit diesem Socket, um das Audio zu lesen
+        self._audio_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._audio_server.bind(("127.0.0.1", 0))
+        self._audio_server.listen(1)
+        self._audio_server.settimeout(10)
+        audio_port = self._audio_server.getsockname()[1]
+
+        command = [
+            "ffmpeg",
+            "-progress", "pipe:1", # Fortschritt (u.a. speed=) für die Telemetrie auf stdout
+            "-nostats",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgra",
+            "-s", f"{width}x{height}",
+            "-framerate", f"{fps}",
+            "-thread_queue_size", "512",
+            "-i", "-", # Video aus stdin
+            "-f", "f32le",
+            "-ar", f"{samplerate}",
+            "-ac", f"{channels}",
+            "-thread_queue_size", "512",
+            "-i", f"tcp://127.0.0.1:{audio_port}", # Audio über lokalen Socket
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-c:v", "libx264",
+            "-crf", X264_CRF,
+            "-preset", X264_PRESET,
+            "-c:a", "aac",
+            "-b:a", "192k",
+            "-pix_fmt", "yuv420p",
+            "-shortest",
+            "-y",
+            partial_output_path(output_path)
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # stderr und stdout laufend leeren, sonst blockiert FFmpeg bei vollem Puffer
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, name="ffmpeg-stderr", daemon=True)
+        self._stderr_thread.start()
+        self._progress_thread = threading.Thread(target=read_ffmpeg_progress, args=(self._process.stdout, self._on_progress),
+                                                 name="ffmpeg-progress", daemon=True)
+        self._progress_thread.start()
+
+    def _on_progress(self, progress):
+        speed = ffmpeg_speed(progress)
+        if speed is not None:
+            self.speed = speed
+
+    def _drain_stderr(self):
+        for line in self._process.stderr:
+            self._stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    def write(self, frame, timestamp):
+        """Schreibt einen BGRA-Frame so oft, wie es sein Zeitstempel im konstanten Raster verlangt."""
+        data = memoryview(np.ascontiguousarray(frame)).cast("B") # Ansicht auf den mss-Puffer, keine Kopie
+        repeats = self.slotter.repeats(timestamp)
+        for _ in range(repeats - 1):
+            self._process.stdin.write(self._previous)
+        if repeats:
+            self._process.stdin.write(data)
+        self._previous = data
+
+    def set_audio_start(self, start_time):
+        """Übernimmt den Zeitpunkt des ersten Audio-Samples (gleiche Uhr wie die Frame-Zeitstempel)."""
+        self.audio_start = start_time
+
+    def _align_audio(self, data):
+        """
+        Gibt die weiterzuleitenden Audioblöcke zurück. Bis Audio-Start und erster Frame bekannt sind,
+        werden die Blöcke zurückgehalten; danach wird Audio vor dem ersten Frame abgeschnitten bzw.
+        ein späterer Audio-Start mit Stille aufgefüllt.
+        """
+        if self.start_offset is None:
+            # Kopie, da data eine Ansicht in den Ringpuffer ist
+            self._pending_audio.append(np.array(data, dtype="<f4"))
+            first_frame = self.slotter.start_time
+            if self.audio_start is None or first_frame is None:
+                return []
+            self.start_offset = first_frame - self.audio_start
+            skip = int(round(self.start_offset * self.samplerate))
+            blocks, self._pending_audio = self._pending_audio, []
+            if skip < 0:
+                blocks.insert(0, np.zeros((-skip, self.channels), dtype="<f4"))
+            self._audio_skip = max(0, skip)
+        else:
+            blocks = [data]
+        aligned = []
+        for block in blocks:
+            if self._audio_skip >= len(block):
+                self._audio_skip -= len(block)
+                continue
+            aligned.append(block[self._audio_skip:])
+            self._audio_skip = 0
+        return aligned
+
+    def _send_audio(self, blocks):
+        if blocks and self._audio_conn is None:
+            self._audio_conn, _ = self._audio_server.accept()
+        for block in blocks:
+            self._audio_conn.sendall(np.ascontiguousarray(block, dtype="<f4").tobytes())
+
+    def write_audio(self, data):
+        """Leitet einen Audioblock (Float32, interleaved) am ersten Frame ausgerichtet an FFmpeg weiter."""
+        with self._audio_lock:
+            if self._closed:
+                return
+            self._send_audio(self._align_audio(data))
+
+    def close(self):
+        """Beendet beide Eingänge und wartet auf das Ende der Kodierung. Gibt True bei Erfolg zurück."""
+        with self._audio_lock:
+            if self._pending_audio:
+                # Ohne Frame bzw. Audio-Start keine Ausrichtung möglich, das Audio geht unverändert weiter
+                try:
+                    self._send_audio(self._pending_audio)
+                except OSError:
+                    pass # FFmpeg hat die Verbindung bereits geschlossen
+                self._pending_audio = []
+            self._closed = True
+            if self._audio_conn is not None:
+                self._audio_conn.close()
+            self._audio_server.close()
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass # FFmpeg hat die Pipe bereits geschlossen
+        returncode = self._process.wait()
+        self._stderr_thread.join()
+        self._progress_thread.join()
+        if returncode != 0:
+            print(f"FEHLER: FFmpeg-Live-Kodierung fehlgeschlagen (Code {returncode}).", file=sys.stderr)
+            for line in self._stderr_tail:
+                print(line, file=sys.stderr)
+            return False
+        os.replace(partial_output_path(self.output_path), self.output_path)
+        if self.start_offset is not None:
+            print(f"Start-Versatz Video zu Audio: {self.start_offset * 1000:.1f} ms (beim Weiterleiten ausgeglichen)")
+        print(f"Live-Kodierung abgeschlossen: {self.output_path} "
+              f"({self.slotter.slots_filled} Frames, {self.slotter.duplicated} ergänzt, {self.slotter.skipped} verworfen)")
+        return True
+
+# --- REPLAY-PUFFER (Modus "replay") ---
+
+class ReplayBuffer:
+    """
+    Hält die letzten REPLAY_SECONDS einer Aufnahme im Arbeitsspeicher: Frames als JPEG,
+    Audio in einem vorab angelegten Ringpuffer. Video-Writer (write) und Audio-Ziel (write_audio)
+    zugleich. Der Speicherbedarf ist unabhängig von der Laufzeit durch REPLAY_MEMORY_MB begrenzt;
+    reicht das Budget nicht für das ganze Zeitfenster, fallen die ältesten Frames früher heraus.
+    """
+
+    pixel_format = "bgr"
+
+    def __init__(self, seconds=REPLAY_SECONDS, memory_mb=REPLAY_MEMORY_MB, jpeg_quality=REPLAY_JPEG_QUALITY,
+                 samplerate=SAMPLERATE, channels=CHANNELS):
+        self.seconds = seconds
+        self.samplerate = samplerate
+        self._lock = threading.Lock() # Schützt beide Speicher gegen gleichzeitiges save_clip
+        self._jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+        # Audio: fester Ringpuffer, eine Sekunde Reserve für den Versatz zwischen Audio und Video
+        self._audio = np.zeros((int(samplerate * (seconds + 1)), channels), dtype=np.float32)
+        self._audio_total = 0 # Insgesamt geschriebene Samples (Position auf der Audio-Zeitachse)
+        self.video_budget = int(memory_mb * 1024 * 1024) - self._audio.nbytes
+        if self.video_budget <= 0:
+            raise ValueError(f"REPLAY_MEMORY_MB reicht nicht einmal für {seconds} s Audio")
+        self._frames = collections.deque() # (Zeitstempel, JPEG-Daten)
+        self._last_frame = None # Zuletzt kodierter Frame, Wiederholungen teilen sich dessen JPEG
+        self.video_bytes = 0
+        self.frames_evicted_for_memory = 0
+
+    def write(self, frame, timestamp):
+        """Kodiert einen Frame als JPEG und verwirft Frames außerhalb des Zeitfensters bzw. Budgets."""
+        if frame is self._last_frame and self._frames:
+            # Wiederholung aus der Duplikaterkennung: gleiche Daten, kein zusätzlicher Speicher
+            data = self._frames[-1][1]
+            added = 0
+        else:
+            ok, data = cv2.imencode(".jpg", frame, self._jpeg_params)
+            if not ok:
+                raise RuntimeError("JPEG-Kodierung fehlgeschlagen")
+            self._last_frame = frame
+            added = data.nbytes
+        with self._lock:
+            self._frames.append((timestamp, data))
+            self.video_bytes += added
+            oldest_allowed = timestamp - self.seconds
+            while len(self._frames) > 1 and (self._frames[0][0] < oldest_allowed or self.video_bytes > self.video_budget):
+                if self._frames[0][0] >= oldest_allowed:
+                    self.frames_evicted_for_memory += 1
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        _, data = self._frames.popleft()
+        # Aufeinanderfolgende Wiederholungen teilen sich die Daten, freigegeben wird erst mit der letzten
+        if data is not self._frames[0][1]:
+            self.video_bytes -= data.nbytes
+
+    def write_audio(self, data):
+        """Hängt Audio-Samples an (Ziel des AudioConsumer), die ältesten werden überschrieben."""
+        capacity = len(self._audio)
+        if len(data) > capacity:
+            data = data[-capacity:]
+        with self._lock:
+            start = self._audio_total % capacity
+            first = min(len(data), capacity - start)
+            self._audio[start:start + first] = data[:first]
+            self._audio[:len(data) - first] = data[first:]
+            self._audio_total += len(data)
+
+    def snapshot(self, audio_start):
+        """
+        Kopiert den aktuellen Inhalt für einen Clip: (Frames, Audio, Zeitpunkt des ersten Audio-Samples).
+        audio_start ist der Startzeitpunkt der Audio-Zeitachse der Aufnahme.
+        """
+        with self._lock:
+            frames = list(self._frames)
+            capacity = len(self._audio)
+            count = min(self._audio_total, capacity)
+            start = (self._audio_total - count) % capacity
+            audio = np.concatenate((self._audio[start:start + count], self._audio[:max(0, start + count - capacity)]))
+            first_sample = self._audio_total - count
+        clip_audio_start = None if audio_start is None else audio_start + first_sample / self.samplerate
+        return frames, audio, clip_audio_start
+
+    def close(self):
+        # Der Inhalt bleibt erhalten, damit nach dem Stopp noch ein Clip gespeichert werden kann
+        return True
+
+    def report(self):
+        with self._lock:
+            window = self._frames[-1][0] - self._frames[0][0] if self._frames else 0.0
+            print(f"Replay-Puffer: {window:.1f} von {self.seconds} s im Speicher, Frames: {self.video_bytes / 1048576:.1f} MB "
+                  f"von {self.video_budget / 1048576:.1f} MB, Audio: {self._audio.nbytes / 1048576:.1f} MB "
+                  f"(wegen Speichergrenze verworfen: {self.frames_evicted_for_memory} Frames)")
+
+
+def write_replay_clip(frames, audio, audio_start, output_path, width, height, fps=FPS, sync_mode=SYNC_MODE,
+                      samplerate=SAMPLERATE, on_progress=None):
+    """
+    Schreibt einen Schnappschuss des Replay-Puffers als Zwischendateien (AVI, WAV, Zeitstempel)
+    und führt ihn über mux_files_with_ffmpeg wie eine normale Aufnahme zusammen. Gibt True bei Erfolg zurück.
+    """
+    if not frames:
+        print("FEHLER: Der Replay-Puffer enthält noch keine Frames.", file=sys.stderr)
+        return False
+    stem = os.path.splitext(output_path)[0]
+    video_path = f"{stem}_{VIDEO_FILENAME}"
+    audio_path = f"{stem}_{AUDIO_FILENAME}"
+    timestamp_path = f"{stem}_{TIMESTAMP_FILENAME}"
+
+    if audio_start is not None:
+        # Der Clip beginnt mit dem ältesten gepufferten Frame: Audio davor wird abgeschnitten, ein späterer
+        # Audio-Start (z.B. kurz nach Beginn der Aufnahme) mit Stille aufgefüllt
+        start_offset = frames[0][0] - audio_start
+        print(f"Start-Versatz Video zu Audio: {start_offset * 1000:.1f} ms")
+        skip = min(len(audio), int(start_offset * samplerate))
+        if skip < 0:
+            audio = np.concatenate([np.zeros((-skip,) + audio.shape[1:], dtype=audio.dtype), audio])
+        else:
+            audio = audio[skip:]
+        audio_start += skip / samplerate
+
+    writer = AviWriter(video_path, width, height, fps, sync_mode)
+    timestamps = TimestampLog(timestamp_path, fps, sync_mode)
+    last_data = frame = None
+    for timestamp, data in frames:
+        if data is not last_data:
+            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            last_data = data
+        writer.write(frame, timestamp)
+        timestamps.append(timestamp)
+    writer.close()
+    timestamps.close(audio_start)
+    sf.write(audio_path, audio, samplerate, subtype=AUDIO_SUBTYPE)
+    print(f"Clip: {len(frames)} Frames ({frames[-1][0] - frames[0][0]:.1f} s), {len(audio) / samplerate:.1f} s Audio")
+    return mux_files_with_ffmpeg(video_path, audio_path, output_path, timestamp_path, fps, sync_mode, on_progress)
+
+
+# --- AUDIO AUFNAHME FUNKTION ---
+
+class AudioRingBuffer:
+    """
+    Vorab angelegter Ringpuffer für Audio-Samples zwischen genau einem Aufnahme-Thread (write)
+    und genau einem Verbraucher (read/consume). Beide Seiten verändern nur ihre eigene Position,
+    daher ist kein Lock nötig: write_position wird erst nach dem Kopieren erhöht, read_position
+    erst nachdem der Verbraucher die Daten verarbeitet hat.
+
+    Die Positionen zählen Samples seit dem Start (inklusive eingefügter Stille) und bilden so eine
+    sample-genaue Zeitachse. Liegt sie über AUDIO_GAP_WINDOW_MS hinweg dauerhaft hinter der Uhr zurück,
+    hat der Treiber Daten verworfen, und die fehlende Zeit wird als Stille eingefügt. Passt ein Block
+    nicht mehr in den Puffer (Überlauf), wird er ebenfalls durch Stille ersetzt, damit die Zeitachse stimmt.
+    """
+
+    def __init__(self, samplerate=SAMPLERATE, channels=CHANNELS, seconds=AUDIO_RING_SECONDS,
+                 gap_threshold_ms=AUDIO_GAP_THRESHOLD_MS, gap_window_ms=AUDIO_GAP_WINDOW_MS, timings=None):
+        self.samplerate = samplerate
+        self.timings = timings # Erhält den Ankunfts-Jitter jedes Blocks als Stufe "audio_jitter"
+        self._last_arrival = None
+        self.capacity = int(samplerate * seconds)
+        self._buffer = np.zeros((self.capacity, channels), dtype=np.float32)
+        self.write_position = 0 # Nur vom Aufnahme-Thread geschrieben
+        self.read_position = 0 # Nur vom Verbraucher geschrieben
+        self.start_time = None # Zeitpunkt des ersten Samples (gleiche Uhr wie die Video-Zeitstempel)
+        self._gap_threshold = int(samplerate * gap_threshold_ms / 1000.0)
+        self._gap_window = gap_window_ms / 1000.0
+        self._window_start = None
+        self._window_deficit = None # Kleinster Fehlbestand im aktuellen Zeitfenster
+        self._pending_silence = 0 # Stille, die noch vor dem nächsten Block eingefügt werden muss
+        self._underrun = False
+        self.frames_captured = 0 # Vom Treiber gelieferte Samples
+        self.gaps = 0 # Erkannte Aussetzer des Treibers
+        self.gap_frames = 0
+        self.overruns = 0 # Blöcke, die wegen eines vollen Puffers verworfen wurden
+        self.overrun_frames = 0
+        self.underruns = 0 # Leerer Puffer, obwohl laut Uhr neue Samples fällig waren
+        self.max_fill = 0 # Höchster Füllstand in Samples
+
+    def write(self, block, now):
+        """Hängt einen aufgenommenen Block an (nur aus dem Aufnahme-Thread). now ist das Ende des Blocks."""
+        frames = len(block)
+        if frames == 0:
+            return
+        if self.start_time is None:
+            # Der erste Block wurde über seine gesamte Länge aufgenommen, bevor record() zurückkehrt
+            self.start_time = now - frames / self.samplerate
+            self._window_start = now
+        else:
+            self._check_gap(now, frames)
+            if self.timings is not None:
+                # Abweichung des Ankunftsabstands von der Dauer des Blocks
+                self.timings.record("audio_jitter", abs(now - self._last_arrival - frames / self.samplerate))
+        self._last_arrival = now
+        self.frames_captured += frames
+
+        if self._pending_silence:
+            silence = min(self._pending_silence, self._free())
+            if silence:
+                self._store(None, silence)
+                self._pending_silence -= silence
+        if self._pending_silence or frames > self._free():
+            # Überlauf: Der Verbraucher kommt nicht hinterher, der Block wird später als Stille nachgetragen
+            self.overruns += 1
+            self.overrun_frames += frames
+            self._pending_silence += frames
+            return
+        self._store(block, frames)
+        self.max_fill = max(self.max_fill, self.write_position - self.read_position)
+
+    def _free(self):
+        return self.capacity - (self.write_position - self.read_position)
+
+    def _check_gap(self, now, frames):
+        """Vergleicht die Sample-Zeitachse mit der Uhr und plant bei einem Aussetzer Stille ein."""
+        expected = int((now - self.start_time) * self.samplerate)
+        deficit = expected - (self.write_position + self._pending_silence + frames)
+        # Ein verspätet zurückkehrendes record() erzeugt nur kurz einen Fehlbestand, daher zählt das Minimum im Zeitfenster
+        if self._window_deficit is None or deficit < self._window_deficit:
+            self._window_deficit = deficit
+        if now - self._window_start < self._gap_window:
+            return
+        if self._gap_threshold and self._window_deficit > self._gap_threshold:
+            self.gaps += 1
+            self.gap_frames += self._window_deficit
+            self._pending_silence += self._window_deficit
+        self._window_start = now
+        self._window_deficit = None
+
+    def _store(self, block, frames):
+        """Kopiert frames Samples (block=None: Stille) an die Schreibposition, am Pufferende in zwei Teilen."""
+        start = self.write_position % self.capacity
+        first = min(frames, self.capacity - start)
+        if block is None:
+            self._buffer[start:start + first] = 0
+            self._buffer[:frames - first] = 0
+        else:
+            self._buffer[start:start + first] = block[:first]
+            self._buffer[:frames - first] = block[first:]
+        # Erst nach dem Kopieren freigeben, der Verbraucher liest nur bis write_position
+        self.write_position += frames
+
+    def read(self, max_frames):
+        """
+        Gibt bis zu max_frames Samples als Ansicht in den Puffer zurück (nur aus dem Verbraucher-Thread),
+        oder None, wenn der Puffer leer ist. Die Ansicht bleibt gültig, bis consume() aufgerufen wird.
+        """
+        available = self.write_position - self.read_position
+        if available <= 0:
+            if self.start_time is not None and not self._underrun:
+                due = int((clock() - self.start_time) * self.samplerate) - self.write_position
+                if due > self._gap_threshold:
+                    self.underruns += 1
+                    self._underrun = True
+            return None
+        self._underrun = False
+        start = self.read_position % self.capacity
+        count = min(available, max_frames, self.capacity - start)
+        return self._buffer[start:start + count]
+
+    def consume(self, frames):
+        """Gibt gelesene Samples für den Aufnahme-Thread frei."""
+        self.read_position += frames
+
+    def clock_lag(self):
+        """Rückstand der Sample-Zeitachse gegenüber der Uhr in Sekunden (A/V-Drift vor der Korrektur durch Stille)."""
+        if self.start_time is None:
+            return 0.0
+        return clock() - self.start_time - (self.write_position + self._pending_silence) / self.samplerate
+
+    def report(self):
+        """Gibt die Zähler für Aussetzer, Über- und Unterläufe aus."""
+        to_ms = 1000.0 / self.samplerate
+        print(f"Audio: {self.frames_captured * to_ms / 1000.0:.1f} s aufgenommen, "
+              f"Aussetzer: {self.gaps} ({self.gap_frames * to_ms:.0f} ms Stille eingefügt), "
+              f"Überläufe: {self.overruns} ({self.overrun_frames * to_ms:.0f} ms), Unterläufe: {self.underruns}, "
+              f"max. Füllstand: {100.0 * self.max_fill / self.capacity:.1f} %")
+
+
+class AudioConsumer:
+    """
+    Liest Samples aus dem Ringpuffer in einem eigenen Thread und reicht sie an sink(data) weiter
+    (Datei oder FFmpeg). Der Aufnahme-Thread wird dadurch nie von Festplatte oder Pipe aufgehalten.
+    """
+
+    def __init__(self, ring, sink, block_frames, poll_seconds=BLOCKSIZE_MS / 2000.0):
+        self.ring = ring
+        self.sink = sink
+        self._block_frames = block_frames
+        self._poll_seconds = poll_seconds
+        self._closing = False
+        self._thread = threading.Thread(target=self._worker, name="audio-consumer")
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            data = self.ring.read(self._block_frames)
+            if data is None:
+                if self._closing:
+                    return
+                time.sleep(self._poll_seconds)
+                continue
+            try:
+                self.sink(data)
+            except Exception as e:
+                print(f"Fehler beim Schreiben der Audiodaten: {e}", file=sys.stderr)
+            self.ring.consume(len(data))
+
+    def close(self):
+        """Wartet, bis alle Samples im Ringpuffer weitergereicht wurden."""
+        self._closing = True
+        self._thread.join()
+
+
+class AudioFileWriter:
+    """
+    Schreibt Audioblöcke fortlaufend in eine geöffnete SoundFile (aufgerufen vom AudioConsumer).
+    Der Speicherbedarf bleibt unabhängig von der Aufnahmelänge konstant, und bei einem Absturz
+    bleibt alles bis zum letzten Flush erhalten.
+    """
+
+    def __init__(self, path, samplerate=SAMPLERATE, channels=CHANNELS, subtype=AUDIO_SUBTYPE, segment_seconds=0):
+        # Mit segment_seconds > 0 ist path ein Muster wie "audio_{index:05d}.wav" und es wird
+        # nach jeweils segment_seconds Sekunden eine neue Datei begonnen (Modus "segmented").
+        self.path = path
+        self.frames_written = 0
+        self._format = dict(samplerate=samplerate, channels=channels, subtype=subtype)
+        self._segment_frames = int(samplerate * segment_seconds)
+        self._segment_index = 0
+        self._frames_in_file = 0
+        self._frames_since_flush = 0
+        self._file = self._open_file()
+        self._flush_interval = int(samplerate * AUDIO_FLUSH_SECONDS)
+
+    def _open_file(self):
+        path = self.path.format(index=self._segment_index) if self._segment_frames else self.path
+        return sf.SoundFile(path, mode='w', **self._format)
+
+    def write(self, data):
+        if self._segment_frames:
+            # Abschnittsgrenzen sample-genau einhalten, ein Block kann auf zwei Dateien verteilt werden
+            remaining = self._segment_frames - self._frames_in_file
+            if len(data) > remaining:
+                self.write(data[:remaining])
+                data = data[remaining:]
+        self._file.write(data)
+        self.frames_written += len(data)
+        self._frames_in_file += len(data)
+        self._frames_since_flush += len(data)
+        if self._segment_frames and self._frames_in_file >= self._segment_frames:
+            # Abschnitt abschließen und den nächsten beginnen
+            self._file.close()
+            self._segment_index += 1
+            self._frames_in_file = 0
+            self._file = self._open_file()
+            self._frames_since_flush = 0
+        elif self._frames_since_flush >= self._flush_interval:
+            self._file.flush()
+            self._frames_since_flush = 0
+
+    def close(self):
+        """Schließt die Datei."""
+        self._file.close()
+
+# --- VIDEO PIPELINE ---
+
+class FrameQueue:
+    """Begrenzte Warteschlange zwischen zwei Pipeline-Stufen mit konfigurierbarem Verhalten bei Überlauf."""
+
+    POLICIES = ("block", "drop_oldest", "drop_newest")
+
+    def __init__(self, name, maxsize=QUEUE_SIZE, policy=QUEUE_FULL_POLICY, on_drop=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unbekannte Queue-Policy '{policy}', erlaubt sind: {', '.join(self.POLICIES)}")
+        self.name = name
+        self.policy = policy
+        self.dropped = 0 # Anzahl der verworfenen Frames an dieser Stufe
+        self.max_depth = 0 # Höchster beobachteter Füllstand
+        self._on_drop = on_drop # Wird mit jedem verworfenen Element aufgerufen (z.B. um Puffer freizugeben)
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def _drop(self, item):
+        self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(item)
+
+    def put(self, item):
+        """Legt ein Element ab. Gibt False zurück, wenn das neue Element verworfen wurde."""
+        depth = self._queue.qsize() + 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.policy == "block":
+            self._queue.put(item)
+            return True
+
+        if self.policy == "drop_newest":
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                self._drop(item)
+                return False
+
+        # drop_oldest: Ältestes Element entfernen, bis Platz für das neue ist
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self._drop(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+
+    def get(self):
+        return self._queue.get()
+
+    def close(self):
+        """Signalisiert der nachfolgenden Stufe das Ende. Das Endsignal wird nie verworfen."""
+        self._queue.put(_END_OF_STREAM)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class FramePool:
+    """
+    Wiederverwendbare Ausgabepuffer gleicher Größe für die Farbkonvertierung.
+    Ein Puffer wird nach dem Schreiben zurückgegeben, so dass im laufenden Betrieb keine neuen
+    Arrays angelegt werden müssen. Neu angelegte Bytes werden für die Auswertung mitgezählt.
+    """
+
+    def __init__(self, shape, preallocate=0):
+        self.shape = shape
+        self._free = queue.SimpleQueue()
+        for _ in range(preallocate):
+            self._free.put(np.empty(shape, dtype=np.uint8))
+        self.allocated_bytes = 0 # Nach dem Vorabanlegen zusätzlich allokierte Bytes
+
+    def acquire(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            buffer = np.empty(self.shape, dtype=np.uint8)
+            self.allocated_bytes += buffer.nbytes
+            return buffer
+
+    def release(self, buffer):
+        self._free.put(buffer)
+
+
+def screenshot_as_array(screenshot):
+    """Gibt die BGRA-Daten eines mss-Screenshots als NumPy-Ansicht ohne Kopie zurück."""
+    return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+
+
+class VideoPipeline:
+    """
+    Entkoppelt Aufnahme, Farbkonvertierung und Kodierung.
+    Der Aufnahme-Thread übergibt nur Screenshots mit Zeitstempel, so dass langsame
+    Schreibvorgänge des Encoders den Takt der Aufnahme nicht mehr verzögern.
+    Akzeptiert der Writer BGRA (pixel_format "bgra"), wird der Puffer von mss ohne Kopie
+    und ohne Konvertierung durchgereicht.
+    Ist ein Screenshot bytegleich mit dem vorherigen, wird nur sein Zeitstempel weitergereicht
+    und der Encoder wiederholt den zuletzt geschriebenen Frame.
+    Mit output_size wird jeder Screenshot vor allen weiteren Schritten auf diese Größe skaliert.
+    Statt eines Screenshots kann auch ein BGRA-Array übergeben werden, z.B. ein Ausschnitt eines
+    gemeinsamen Screenshots (siehe ScreenCapture).
+    """
+
+    def __init__(self, writer, timestamps, queue_size=QUEUE_SIZE, policy=QUEUE_FULL_POLICY, timings=None,
+                 detect_duplicates=DUPLICATE_DETECTION, output_size=None):
+        self.writer = writer
+        self.timestamps = timestamps # Empfänger der Zeitstempel geschriebener Frames (z.B. TimestampLog) oder None
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.timings = timings
+        self.convert_queue = FrameQueue("Konvertierung", queue_size, policy)
+        self.encode_queue = FrameQueue("Kodierung", queue_size, policy, on_drop=self._on_encode_drop)
+        self.needs_conversion = getattr(writer, "pixel_format", "bgr") != "bgra"
+        self.queue_size = queue_size
+        self._pool = None # Wird mit dem ersten Frame in dessen Größe angelegt
+        self.output_size = tuple(output_size) if output_size else None # (Breite, Höhe) der geschriebenen Frames
+        self.capture_size = None # (Breite, Höhe) der Screenshots, für die Auswertung
+        self._scale_buffer = None # Zwischenpuffer für das verkleinerte BGRA-Bild vor der Farbkonvertierung
+        self.detect_duplicates = detect_duplicates
+        self._previous = None # Rohdaten bzw. Array des zuletzt konvertierten Screenshots
+        self._source_id = 0 # Laufende Nummer der konvertierten Frames, auf die sich Wiederholungen beziehen
+        self._lost_source_id = None # Nummer einer Vorlage, die verworfen wurde oder nicht geschrieben werden konnte
+        self.frames_captured = 0
+        self.frames_converted = 0
+        self.frames_unchanged = 0 # Als Wiederholung erkannte Frames (ohne Konvertierung)
+        self.duplicates_orphaned = 0 # Wiederholungen, deren Vorlage vor dem Encoder verworfen wurde
+        self.frames_written = 0
+        self._threads = [
+            threading.Thread(target=self._convert_worker, name="video-convert"),
+            threading.Thread(target=self._encode_worker, name="video-encode"),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, timestamp, screenshot):
+        """Wird vom Aufnahme-Thread aufgerufen und blockiert nur bei der Policy 'block'."""
+        self.frames_captured += 1
+        self.convert_queue.put((timestamp, screenshot))
+
+    def finish(self):
+        """Leert die Warteschlangen und wartet, bis alle Frames geschrieben sind."""
+        self.convert_queue.close()
+        for thread in self._threads:
+            thread.join()
+
+    def _convert_worker(self):
+        while True:
+            item = self.convert_queue.get()
+            if item is _END_OF_STREAM:
+                self.encode_queue.close()
+                return
+            timestamp, screenshot = item
+            stage_start = time.perf_counter()
+            # Ausschnitte kommen als Array, vollständige Screenshots mit ihren Rohdaten
+            current = screenshot if isinstance(screenshot, np.ndarray) else screenshot.raw
+            if self._lost_source_id == self._source_id:
+                # Die Vorlage hat den Encoder nicht erreicht; ohne Neukonvertierung würden alle
+                # folgenden gleichen Frames als verwaiste Wiederholungen verworfen
+                self._previous = None
+            if self.detect_duplicates and self._previous is not None and self._unchanged(current):
+                self.frames_unchanged += 1
+                self.encode_queue.put((timestamp, None, False, self._source_id))
+                continue
+            try:
+                bgra = current if current is screenshot else screenshot_as_array(screenshot)
+                frame, pooled = self._prepare(bgra)
+            except Exception as e:
+                print(f"Fehler bei der Frame-Konvertierung: {e}", file=sys.stderr)
+                continue
+            self.frames_converted += 1
+            self._previous = current
+            self._source_id += 1
+            if self.timings is not None:
+                self.timings.record("convert", time.perf_counter() - stage_start)
+            self.encode_queue.put((timestamp, frame, pooled, self._source_id))
+
+    def _unchanged(self, current):
+        """Vergleicht mit dem zuletzt konvertierten Screenshot."""
+        if isinstance(current, np.ndarray):
+            # Ausschnitte liegen nicht zusammenhängend im Speicher; cv2.norm vergleicht zeilenweise ohne Kopie
+            return (isinstance(self._previous, np.ndarray) and current.shape == self._previous.shape
+                    and cv2.norm(current, self._previous, cv2.NORM_INF) == 0)
+        # Bytevergleich (memcmp) des ganzen Bildes, bricht beim ersten Unterschied ab
+        return not isinstance(self._previous, np.ndarray) and current == self._previous
+
+    def _prepare(self, bgra):
+        """
+        Skaliert und konvertiert einen Screenshot für den Writer. Gibt (frame, pooled) zurück,
+        pooled gibt an, ob der Frame aus dem Puffer-Pool stammt.
+        """
+        height, width = bgra.shape[:2]
+        self.capture_size = (width, height)
+        if self.output_size is not None and self.output_size != self.capture_size:
+            out_width, out_height = self.output_size
+            if not self.needs_conversion:
+                # BGRA-Writer: direkt in den Ausgabepuffer verkleinern
+                return self._resize_into(bgra, self._acquire((out_height, out_width, 4))), True
+            # Erst verkleinern, dann konvertieren, damit cvtColor nur über die Ausgabegröße läuft
+            if self._scale_buffer is None or self._scale_buffer.shape[:2] != (out_height, out_width):
+                self._scale_buffer = np.empty((out_height, out_width, 4), dtype=np.uint8)
+            cv2.resize(bgra, self.output_size, dst=self._scale_buffer, interpolation=cv2.INTER_AREA)
+            bgra = self._scale_buffer
+        if self.needs_conversion:
+            return self._convert(bgra), True
+        return bgra, False
+
+    def _acquire(self, shape):
+        """Holt einen Puffer der angegebenen Form aus dem Pool."""
+        if self._pool is None or self._pool.shape != shape:
+            # Je ein Puffer pro Platz in der Warteschlange, die beiden gerade bearbeiteten
+            # und die Vorlage für Wiederholungen im Encoder
+            self._pool = FramePool(shape, preallocate=self.queue_size + 3)
+        return self._pool.acquire()
+
+    def _resize_into(self, bgra, buffer):
+        """Verkleinert mit Flächenmittelung (INTER_AREA) in einen Puffer aus dem Pool."""
+        try:
+            cv2.resize(bgra, self.output_size, dst=buffer, interpolation=cv2.INTER_AREA)
+        except Exception:
+            self._pool.release(buffer)
+            raise
+        return buffer
+
+    def _convert(self, bgra):
+        """Konvertiert BGRA nach BGR in einen wiederverwendeten Puffer statt in ein neues Array."""
+        buffer = self._acquire((bgra.shape[0], bgra.shape[1], 3))
+        try:
+            cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=buffer)
+        except Exception:
+            self._pool.release(buffer)
+            raise
+        return buffer
+
+    def _release_item(self, item):
+        """Gibt den Konvertierungspuffer eines geschriebenen oder verworfenen Frames zurück."""
+        _, frame, pooled, _ = item
+        if pooled:
+            self._pool.release(frame)
+
+    def _on_encode_drop(self, item):
+        """Gibt den Puffer eines vor dem Encoder verworfenen Frames zurück und merkt sich verworfene Vorlagen."""
+        self._release_item(item)
+        if item[1] is not None:
+            self._lost_source_id = item[3]
+
+    def _encode_worker(self):
+        last_item = None # Zuletzt geschriebener echter Frame, Vorlage für Wiederholungen
+        while True:
+            item = self.encode_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            timestamp, frame, _, source_id = item
+            if frame is None:
+                if last_item is None or last_item[3] != source_id:
+                    # Die Vorlage wurde verworfen, eine Wiederholung des älteren Frames wäre falsch
+                    self.duplicates_orphaned += 1
+                    self._lost_source_id = source_id
+                    continue
+                frame = last_item[1]
+            stage_start = time.perf_counter()
+            try:
+                self.writer.write(frame, timestamp)
+            except Exception as e:
+                print(f"Fehler beim Schreiben des Frames: {e}", file=sys.stderr)
+                self._release_item(item)
+                if item[1] is not None:
+                    self._lost_source_id = source_id
+                continue
+            if item[1] is not None:
+                # Der neue Frame wird zur Vorlage, die alte Vorlage kann zurück in den Pool. Erst nach dem
+                # Schreiben, denn der Writer füllt Lücken vor dem neuen Frame noch mit der alten Vorlage.
+                if last_item is not None:
+                    self._release_item(last_item)
+                last_item = item
+            if self.timestamps is not None:
+                self.timestamps.append(timestamp) # Zeitstempel des geschriebenen Frames speichern
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+            self.frames_written += 1
+            if self.timings is not None:
+                self.timings.record("encode", time.perf_counter() - stage_start)
+                # Gesamtlatenz von der Aufnahme bis zum geschriebenen Frame
+                self.timings.record("total", clock() - timestamp)
+        if last_item is not None:
+            self._release_item(last_item)
+
+    def report(self):
+        """Gibt die Frame-Zähler und Verluste je Stufe aus."""
+        print(f"Frames aufgenommen: {self.frames_captured}, konvertiert: {self.frames_converted}, geschrieben: {self.frames_written}")
+        for stage_queue in (self.convert_queue, self.encode_queue):
+            print(f"Verworfene Frames vor Stufe '{stage_queue.name}': {stage_queue.dropped} (Policy: {stage_queue.policy})")
+        if self.detect_duplicates and self.frames_captured:
+            ratio = 100.0 * self.frames_unchanged / self.frames_captured
+            print(f"Unveränderte Frames ohne Konvertierung: {self.frames_unchanged} ({ratio:.1f} %), "
+                  f"verwaiste Wiederholungen: {self.duplicates_orphaned}")
+        conversion = "BGRA->BGR in wiederverwendete Puffer" if self.needs_conversion else "keine (BGRA direkt an den Encoder)"
+        # Nur der Zuwachs des Pufferpools; alle Allokationen pro Frame misst Benchmark.py --allocations
+        pool_growth = self._pool.allocated_bytes / 1048576 if self._pool is not None else 0.0
+        print(f"Konvertierung: {conversion}, Pufferpool nachträglich vergrößert um {pool_growth:.1f} MB")
+        if self.output_size is not None and self.capture_size is not None and self.output_size != self.capture_size:
+            print(f"Skalierung: {self.capture_size[0]}x{self.capture_size[1]} -> "
+                  f"{self.output_size[0]}x{self.output_size[1]} (INTER_AREA)")
+
+
+# --- TAKTGEBER ---
+
+class FrameScheduler:
+    """
+    Gibt den Aufnahmetakt mit absoluten Terminen vor: Frame N ist fällig bei Start + N/FPS.
+    Es wird bis kurz vor dem Termin geschlafen und der Rest aktiv gewartet, damit die
+    Genauigkeit unter einer Millisekunde liegt, ohne dass sich Verspätungen aufsummieren.
+    """
+
+    POLICIES = ("skip", "catchup")
+
+    def __init__(self, fps, policy=MISSED_FRAME_POLICY, spin_ms=SCHEDULER_SPIN_MS):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unbekannte Policy '{policy}' für verpasste Frames, erlaubt sind: {', '.join(self.POLICIES)}")
+        self.fps = fps
+        self.policy = policy
+        self._spin_ns = int(spin_ms * 1_000_000)
+        self._start_ns = None
+        self.frame_index = 0
+        self.missed = 0 # Termine, die erst nach ihrer Fälligkeit erreicht wurden
+        self.skipped = 0 # Übersprungene Frames (Policy "skip")
+
+    def _deadline_ns(self, index):
+        # Immer vom Start aus rechnen, damit sich Rundungsfehler nicht aufsummieren
+        return self._start_ns + int(index * 1_000_000_000 // self.fps)
+
+    def wait_next(self):
+        """
+        Wartet auf den Termin des nächsten Frames und gibt dessen Zeitstempel (Sekunden, clock()) zurück.
+        Bei "catchup" ist das für nachgeholte Frames der verpasste Termin statt der aktuellen Zeit: Sonst
+        erhielten sie fast gleiche Zeitstempel und FrameSlotter würde sie im Modus "timestamps" verwerfen.
+        """
+        now = time.perf_counter_ns()
+        if self._start_ns is None:
+            self._start_ns = now
+            return now / 1e9
+
+        self.frame_index += 1
+        deadline = self._deadline_ns(self.frame_index)
+        if now >= deadline:
+            self.missed += 1
+            if self.policy == "skip":
+                # Alle vollständig verpassten Termine überspringen statt sie im Eiltempo nachzuholen
+                behind = int((now - deadline) * self.fps // 1_000_000_000)
+                self.frame_index += behind
+                self.skipped += behind
+                return now / 1e9
+            # Nachgeholte Frames belegen ihren eigenen Rasterplatz
+            return deadline / 1e9
+
+        remaining = deadline - now
+        if remaining > self._spin_ns:
+            time.sleep((remaining - self._spin_ns) / 1e9)
+        while time.perf_counter_ns() < deadline:
+            pass
+        return time.perf_counter_ns() / 1e9
+
+    def change_fps(self, fps):
+        """Ändert den Takt ab dem nächsten Termin, ohne Sprung in der Zeitachse."""
+        if self._start_ns is not None:
+            self._start_ns = self._deadline_ns(self.frame_index)
+            self.frame_index = 0
+        self.fps = fps
+
+    def report(self):
+        print(f"Taktgeber: {self.missed} Termine verspätet erreicht, {self.skipped} Frames übersprungen (Policy: {self.policy})")
+
+
+# --- TELEMETRIE ---
+
+class Histogram:
+    """Laufzeit-Histogramm mit festen Klassengrenzen (Sekunden); der Speicherbedarf hängt nicht von der Aufnahmelänge ab."""
+
+    BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1) # Letzte Klasse: alles über der größten Grenze
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Obergrenze der Klasse, in die das Quantil fällt (in der letzten Klasse das Maximum)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "p50_ms": self.quantile(0.5) * 1000, "p95_ms": self.quantile(0.95) * 1000,
+                "p99_ms": self.quantile(0.99) * 1000, "max_ms": self.max * 1000}
+
+
+class Telemetry:
+    """
+    Sammelt die Messwerte einer Aufnahme: Laufzeit-Histogramme je Stufe (als timings-Empfänger,
+    Weitergabe an einen weiteren Empfänger) und Messgrößen aus registrierten Quellen, z.B. Füllstände
+    der Warteschlangen, verworfene Frames, A/V-Drift oder die FFmpeg-Geschwindigkeit. Exportiert
+    periodisch als JSON-Zeilen oder Prometheus-Textdatei und gibt am Ende eine Zusammenfassung aus.
+    """
+
+    FORMATS = (None, "jsonl", "prometheus")
+
+    def __init__(self, path_stem, export_format=TELEMETRY_FORMAT, interval=TELEMETRY_INTERVAL_SECONDS, timings=None):
+        if export_format not in self.FORMATS:
+            raise ValueError(f"Unbekanntes Telemetrie-Format '{export_format}', erlaubt sind: jsonl, prometheus")
+        self.export_format = export_format
+        extension = ".jsonl" if export_format == "jsonl" else ".prom"
+        self.path = f"{path_stem}_{TELEMETRY_FILENAME}{extension}" if export_format else None
+        self.interval = interval
+        self.timings = timings
+        self.histograms = {}
+        self.gauges = {} # Letzter Wert je Messgröße
+        self._ranges = {} # (Minimum, Maximum) je Messgröße über die ganze Aufnahme
+        self._sources = []
+        self._start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, stage, seconds):
+        """Schnittstelle wie StageTimings im Benchmark, wird aus allen Pipeline-Threads aufgerufen."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+        if self.timings is not None:
+            self.timings.record(stage, seconds)
+
+    def add_source(self, source):
+        """Registriert eine Funktion, die ein dict mit aktuellen Messgrößen (Name -> Zahl) liefert."""
+        self._sources.append(source)
+
+    def set_gauge(self, name, value):
+        if value is None:
+            return
+        self.gauges[name] = value
+        low, high = self._ranges.get(name, (value, value))
+        self._ranges[name] = (min(low, value), max(high, value))
+
+    def ffmpeg_progress(self, progress):
+        """Empfänger für run_ffmpeg: übernimmt die Kodiergeschwindigkeit beim Muxing."""
+        self.set_gauge("ffmpeg_mux_speed", ffmpeg_speed(progress))
+
+    def start(self):
+        self._start = clock()
+        if self.export_format and self._thread is None:
+            self._thread = threading.Thread(target=self._export_worker, name="telemetry", daemon=True)
+            self._thread.start()
+
+    def _export_worker(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def sample(self):
+        """Fragt alle Quellen ab."""
+        for source in list(self._sources):
+            try:
+                for name, value in source().items():
+                    self.set_gauge(name, value)
+            except Exception as e:
+                print(f"Fehler beim Erfassen der Telemetrie: {e}", file=sys.stderr)
+
+    def export(self):
+        """Schreibt den aktuellen Stand in die Exportdatei (JSON-Zeile anhängen bzw. Prometheus-Datei ersetzen)."""
+        self.sample()
+        if not self.export_format:
+            return
+        try:
+            if self.export_format == "jsonl":
+                record = {"time": time.time(), "elapsed": clock() - (self._start or clock()),
+                          "stages": {stage: histogram.summary() for stage, histogram in list(self.histograms.items())},
+                          **self.gauges}
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            else:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, "w") as f:
+                    f.write(self._prometheus_text())
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"FEHLER beim Schreiben der Telemetrie nach {self.path}: {e}", file=sys.stderr)
+
+    def _prometheus_text(self):
+        lines = ["# TYPE videorecorder_stage_seconds histogram"]
+        for stage, histogram in list(self.histograms.items()):
+            cumulative = 0
+            for bound, bucket in zip(Histogram.BOUNDS + (float("inf"),), histogram.buckets):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'videorecorder_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'videorecorder_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+            lines.append(f'videorecorder_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in self.gauges.items():
+            lines.append(f"# TYPE videorecorder_{name} gauge")
+            lines.append(f"videorecorder_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def stop(self):
+        """Beendet den periodischen Export, schreibt den Endstand und gibt die Zusammenfassung aus."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+        self.report()
+
+    def report(self):
+        print("\nTelemetrie:")
+        print(f"  {'Stufe':<13}{'Anzahl':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for stage, histogram in sorted(self.histograms.items()):
+            summary = histogram.summary()
+            print(f"  {stage:<13}{summary['count']:>8}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}"
+                  f"{summary['p99_ms']:>10.2f}{summary['max_ms']:>10.2f}")
+        for name, value in sorted(self.gauges.items()):
+            low, high = self._ranges[name]
+            print(f"  {name}: {value:g} (Bereich {low:g} .. {high:g})")
+        if self.path:
+            print(f"  Export: {self.path}")
+
+
+# --- ADAPTIVE REGELUNG ---
+
+class AdaptiveController:
+    """
+    Regelt die Aufnahmerate anhand der gemessenen Last der Pipeline.
+    Nimmt als timings-Empfänger die Laufzeiten je Stufe entgegen (und reicht sie an einen
+    weiteren Empfänger durch) und wertet sie zusammen mit Warteschlangen, verpassten Terminen
+    und verworfenen Frames in festen Zeitfenstern aus. Jede Änderung wird mit Begründung ausgegeben.
+
+    Nur Aufnahme und Konvertierung arbeiten je aufgenommenem Frame und werden durch eine niedrigere Rate
+    entlastet. Der Writer füllt dagegen jeden Zeitschlitz von 1/FPS (siehe FrameSlotter), die Last der
+    Kodierung bleibt also gleich. Ist sie der Engpass, wird die Rate daher nicht gesenkt, sondern ggf.
+    wieder angehoben; Warteschlangen, verpasste Termine und Verluste gehen dann ebenfalls auf sie zurück.
+    """
+
+    LOAD_STAGES = ("grab", "convert", "encode") # Stufen, deren Laufzeit die Auslastung bestimmt
+    RATE_STAGES = ("grab", "convert") # Stufen, deren Last mit der Aufnahmerate sinkt
+
+    def __init__(self, fps, divisors=ADAPTIVE_FPS_DIVISORS, window_seconds=ADAPTIVE_WINDOW_SECONDS,
+                 high_load=ADAPTIVE_HIGH_LOAD, low_load=ADAPTIVE_LOW_LOAD,
+                 step_down_windows=ADAPTIVE_STEP_DOWN_WINDOWS, step_up_windows=ADAPTIVE_STEP_UP_WINDOWS, timings=None):
+        self.rates = [fps / divisor for divisor in sorted(divisors)]
+        self.level = 0 # Index in rates, 0 = volle Rate
+        self.window_seconds = window_seconds
+        self.high_load = high_load
+        self.low_load = low_load
+        self.step_down_windows = step_down_windows
+        self.step_up_windows = step_up_windows
+        self.timings = timings
+        self.adjustments = [] # (Sekunden seit Start, alte Rate, neue Rate, Grund)
+        self._busy = {} # Summierte Laufzeit je Stufe im aktuellen Fenster
+        self._start = None
+        self._window_start = None
+        self._queue_fill = 0.0
+        self._queue_samples = 0
+        self._missed = 0
+        self._dropped = 0
+        self._overloaded_windows = 0
+        self._relaxed_windows = 0
+        self._time_at_level = [0.0] * len(self.rates)
+        self.encode_bound_windows = 0 # Fenster, in denen die Kodierung der Engpass war
+
+    @property
+    def fps(self):
+        return self.rates[self.level]
+
+    def record(self, stage, seconds):
+        """Schnittstelle wie StageTimings im Benchmark, wird aus allen Pipeline-Threads aufgerufen."""
+        self._busy[stage] = self._busy.get(stage, 0.0) + seconds
+        if self.timings is not None:
+            self.timings.record(stage, seconds)
+
+    def update(self, now, pipeline, scheduler):
+        """
+        Wird vom Aufnahme-Thread einmal pro Frame aufgerufen. Gibt die neue Aufnahmerate zurück,
+        wenn sie geändert werden soll, sonst None.
+        """
+        if self._window_start is None:
+            self._start = self._window_start = now
+            self._missed = scheduler.missed
+            self._dropped = self._dropped_frames(pipeline)
+            return None
+        self._queue_fill += max(pipeline.convert_queue.qsize(), pipeline.encode_queue.qsize()) / pipeline.queue_size
+        self._queue_samples += 1
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return None
+
+        busy, self._busy = self._busy, {}
+        load = {stage: busy.get(stage, 0.0) / elapsed for stage in self.LOAD_STAGES}
+        queue_fill = self._queue_fill / max(1, self._queue_samples)
+        missed = scheduler.missed - self._missed
+        dropped = self._dropped_frames(pipeline) - self._dropped
+        self._time_at_level[self.level] += elapsed
+        self._window_start = now
+        self._queue_fill = 0.0
+        self._queue_samples = 0
+        self._missed = scheduler.missed
+        self._dropped += dropped
+
+        busiest = max(self.RATE_STAGES, key=load.get)
+        encode_bound = load["encode"] > self.high_load
+        reasons = []
+        if load[busiest] > self.high_load:
+            reasons.append(f"Stufe '{busiest}' zu {100 * load[busiest]:.0f} % ausgelastet")
+        if encode_bound:
+            # Eine niedrigere Rate hilft hier nicht, Rückstau und Verluste stammen dann von der Kodierung
+            self.encode_bound_windows += 1
+            if self.encode_bound_windows == 1:
+                print(f"Hinweis: Stufe 'encode' zu {100 * load['encode']:.0f} % ausgelastet. Jeder Zeitschlitz wird "
+                      f"geschrieben, eine niedrigere Aufnahmerate entlastet sie nicht (OUTPUT_SIZE oder X264_PRESET anpassen).")
+        else:
+            if queue_fill > 0.5:
+                reasons.append(f"Warteschlangen im Mittel zu {100 * queue_fill:.0f} % gefüllt")
+            if missed > 0.1 * elapsed * self.fps:
+                reasons.append(f"{missed} Termine verpasst")
+            if dropped:
+                reasons.append(f"{dropped} Frames verworfen")
+
+        if reasons:
+            self._relaxed_windows = 0
+            self._overloaded_windows += 1
+            if self._overloaded_windows >= self.step_down_windows and self.level < len(self.rates) - 1:
+                return self._change(now, self.level + 1, ", ".join(reasons))
+            return None
+
+        self._overloaded_windows = 0
+        if self.level == 0:
+            return None
+        # Last auf die nächsthöhere Rate hochrechnen, damit nicht sofort wieder zurückgeschaltet wird
+        projected = load[busiest] * self.rates[self.level - 1] / self.fps
+        if projected < self.low_load and (encode_bound or (queue_fill < 0.1 and not missed)):
+            self._relaxed_windows += 1
+            if self._relaxed_windows >= self.step_up_windows:
+                return self._change(now, self.level - 1, f"Last gesunken, hochgerechnet {100 * projected:.0f} % "
+                                                         f"bei höherer Rate")
+        else:
+            self._relaxed_windows = 0
+        return None
+
+    @staticmethod
+    def _dropped_frames(pipeline):
+        return pipeline.convert_queue.dropped + pipeline.encode_queue.dropped
+
+    def _change(self, now, level, reason):
+        old_fps = self.fps
+        self.level = level
+        self._overloaded_windows = 0
+        self._relaxed_windows = 0
+        self.adjustments.append((now - self._start, old_fps, self.fps, reason))
+        print(f"Regelung nach {now - self._start:.1f} s: Aufnahmerate {old_fps:g} -> {self.fps:g} FPS ({reason})")
+        return self.fps
+
+    def report(self):
+        shares = ", ".join(f"{rate:g} FPS: {seconds:.0f} s" for rate, seconds in zip(self.rates, self._time_at_level) if seconds)
+        print(f"Regelung: {len(self.adjustments)} Änderungen der Aufnahmerate ({shares or 'keine Messung'})")
+        if self.encode_bound_windows:
+            print(f"Kodierung war in {self.encode_bound_windows} Messfenster(n) der Engpass (Rate dafür nicht gesenkt)")
+
+
+# --- AUFNAHME (auch ohne GUI als Bibliothek nutzbar) ---
+
+def crop_region(region, crop):
+    """Schneidet einen Ausschnitt (x, y, Breite, Höhe) relativ zum Aufnahmebereich aus."""
+    x, y, width, height = (int(value) for value in crop)
+    if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > region["width"] or y + height > region["height"]:
+        raise ValueError(f"Ausschnitt {crop} liegt nicht im Aufnahmebereich {region['width']}x{region['height']}")
+    return {"left": region["left"] + x, "top": region["top"] + y, "width": width, "height": height}
+
+
+class Recorder:
+    """
+    Eine Aufnahme eines Bildschirmbereichs mit System-Audio.
+    Der gesamte Zustand liegt in der Instanz, daher können mehrere Aufnahmen
+    (z.B. verschiedener Bereiche) gleichzeitig in einem Prozess laufen.
+
+        recorder = Recorder({"left": 0, "top": 0, "width": 1280, "height": 720}, "demo.mp4")
+        recorder.start()
+        time.sleep(10)
+        recorder.stop()
+        recorder.finalize()
+    """
+
+    def __init__(self, region, output_path=None, fps=FPS, mode=RECORDING_MODE, sync_mode=SYNC_MODE, timings=None,
+                 output_size=OUTPUT_SIZE, crop=CROP, adaptive=ADAPTIVE_CONTROL, telemetry_format=TELEMETRY_FORMAT):
+        if mode not in RECORDING_MODES:
+            raise ValueError(f"Unbekannter Aufnahmemodus: {mode}")
+        self.region = {key: int(region[key]) for key in ("left", "top", "width", "height")}
+        if crop is not None:
+            # Zugeschnitten wird schon beim Screenshot: mss kopiert nur den benötigten Ausschnitt
+            self.region = crop_region(self.region, crop)
+        # Größe der geschriebenen Frames (Writer, Zwischendatei und Kodierung)
+        self.frame_size = tuple(output_size) if output_size else (self.region["width"], self.region["height"])
+        self.fps = fps
+        self.mode = mode
+        self.sync_mode = sync_mode
+        self.timings = timings # Optionaler Empfänger für Laufzeiten je Pipeline-Stufe (Methode record(stage, sekunden))
+        # Eine wechselnde Aufnahmerate ist nur unschädlich, wenn jeder Frame anhand seines Zeitstempels platziert wird.
+        # Das gilt im Modus "stream" immer; Replay-Clips werden wie "avi" mit SYNC_MODE geschrieben.
+        self.adaptive = adaptive and (mode == "stream" or sync_mode == "timestamps")
+        if adaptive and not self.adaptive:
+            print("Hinweis: Adaptive Regelung ist nur mit SYNC_MODE = 'timestamps' möglich und wird deaktiviert.")
+        # Ohne Angabe wird der nächste freie Name vergeben, auch gegenüber anderen Aufnahmen im selben Prozess
+        self.output_path = output_path or reserve_output_filename(OUTPUT_FILENAME)
+        # Zwischendateien liegen neben der Ausgabedatei, z.B. output_aufnahme.avi
+        stem = self._stem = os.path.splitext(self.output_path)[0]
+        self.video_path = f"{stem}_{VIDEO_FILENAME}"
+        self.audio_path = f"{stem}_{AUDIO_FILENAME}"
+        self.timestamp_path = f"{stem}_{TIMESTAMP_FILENAME}"
+        # Misst alle Stufen und reicht die Laufzeiten an timings weiter
+        self.telemetry = Telemetry(stem, telemetry_format, TELEMETRY_INTERVAL_SECONDS, timings)
+
+        self.stop_event = threading.Event()
+        self._capture = None # ScreenCapture mit Video- und Audio-Thread
+        self.stream_writer = None # FfmpegStreamWriter im Modus "stream"
+        self.session_dir = None # Sitzungsverzeichnis im Modus "segmented"
+        self.replay = None # ReplayBuffer im Modus "replay"
+        self.audio_start_time = None # Zeitpunkt des ersten Audio-Samples (gleiche Uhr wie die Video-Zeitstempel)
+        self._stream_ok = False
+        self._timestamps = None # TimestampLog im Modus "avi", abgeschlossen in stop()
+        self._segment_writer = None # SegmentedAviWriter im Modus "segmented"
+
+    def start(self):
+        """Startet Video- und Audioaufnahme in eigenen Threads und kehrt sofort zurück."""
+        self._open_outputs()
+        self._capture = ScreenCapture([self], self.fps, self.stop_event, self.adaptive)
+        self._capture.start()
+
+    def _open_outputs(self):
+        """Legt je nach Modus FFmpeg-Prozess, Sitzungsverzeichnis oder Replay-Puffer an und startet die Telemetrie."""
+        width, height = self.frame_size
+        if self.mode == "stream":
+            # Im Live-Modus muss der Ausgabename schon vor dem Start feststehen
+            self.stream_writer = FfmpegStreamWriter(self.output_path, width, height, self.fps)
+        elif self.mode == "segmented":
+            self.session_dir = create_session_dir(width, height, self.fps, self.sync_mode, self.output_path)
+        elif self.mode == "replay":
+            self.replay = ReplayBuffer(REPLAY_SECONDS, REPLAY_MEMORY_MB, REPLAY_JPEG_QUALITY)
+            self.telemetry.add_source(lambda: {"replay_video_mb": self.replay.video_bytes / 1048576})
+        else:
+            # Der Name der Zwischendateien legt nur den Stamm fest, nicht die Endung (z.B. --output vortrag.mkv)
+            write_json_atomic(f"{self._stem}_{RECORDING_META_FILENAME}", {"output": os.path.abspath(self.output_path)})
+        if self.stream_writer is not None:
+            self.telemetry.add_source(lambda: {"ffmpeg_live_speed": self.stream_writer.speed})
+        self.telemetry.start()
+
+    def request_stop(self):
+        """Signalisiert das Ende der Aufnahme, ohne auf die Threads zu warten (z.B. aus der GUI)."""
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        """Wartet bis zum Ende der Aufnahme oder bis timeout abgelaufen ist. Gibt True zurück, wenn sie beendet wurde."""
+        return self.stop_event.wait(timeout)
+
+    def stop(self):
+        """Beendet die Aufnahme und wartet, bis Video- und Audio-Thread ihre Dateien geschlossen haben."""
+        self.stop_event.set()
+        if self._capture is not None:
+            self._capture.join()
+        self._close_outputs()
+
+    def _close_outputs(self):
+        self.telemetry.stop()
+        # Erst wenn beide Threads ihre Dateien geschlossen haben, gilt die Aufnahme als vollständig (siehe MuxQueue.py)
+        if self._timestamps is not None:
+            self._timestamps.close(self.audio_start_time)
+            print(f"Zeitstempel unter {self.timestamp_path} gespeichert ({self._timestamps.count} Frames).")
+        if self.session_dir is not None:
+            update_session_meta(self.session_dir, complete=True)
+
+    def finalize(self):
+        """Erstellt die fertige MP4 nach stop(). Gibt den Ausgabepfad zurück oder None bei Fehler."""
+        if self.mode == "stream":
+            ok = self._stream_ok
+        elif self.mode == "segmented":
+            ok = self.session_dir is not None and finalize_session(self.session_dir, self.output_path,
+                                                                   self.telemetry.ffmpeg_progress)
+        elif self.mode == "replay":
+            # Nach dem Stopp wird das zuletzt gepufferte Zeitfenster als Ausgabedatei gespeichert
+            return self.save_clip(self.output_path)
+        else:
+            ok = mux_files_with_ffmpeg(self.video_path, self.audio_path, self.output_path, self.timestamp_path,
+                                       self.fps, self.sync_mode, self.telemetry.ffmpeg_progress)
+            if ok:
+                remove_recording_meta(self._stem)
+        self._report_mux_speed()
+        if not ok:
+            release_output_filename(self.output_path)
+        return self.output_path if ok else None
+
+    def _report_mux_speed(self):
+        """Hängt die beim Muxing gemessene FFmpeg-Geschwindigkeit an den Telemetrie-Export an."""
+        if "ffmpeg_mux_speed" not in self.telemetry.gauges:
+            return
+        self.telemetry.export()
+        print(f"FFmpeg-Geschwindigkeit beim Muxing: {self.telemetry.gauges['ffmpeg_mux_speed']:g}x Echtzeit")
+
+    def save_clip(self, output_path=None):
+        """
+        Speichert im Modus "replay" die letzten REPLAY_SECONDS als MP4, auch während die Aufnahme weiterläuft.
+        Gibt den Pfad des Clips zurück oder None bei Fehler.
+        """
+        if self.replay is None:
+            raise RuntimeError("save_clip ist nur im Modus 'replay' verfügbar")
+        output_path = output_path or reserve_output_filename(REPLAY_FILENAME)
+        frames, audio, audio_start = self.replay.snapshot(self.audio_start_time)
+        width, height = self.frame_size
+        print(f"\nSpeichere Clip unter {output_path}...")
+        ok = write_replay_clip(frames, audio, audio_start, output_path, width, height, self.fps, self.sync_mode,
+                               on_progress=self.telemetry.ffmpeg_progress)
+        self._report_mux_speed()
+        if not ok:
+            release_output_filename(output_path)
+        return output_path if ok else None
+
+    def _open_audio_output(self, samplerate, channels):
+        """Gibt (Audiodatei oder None, Ziel der Audioblöcke) für den Aufnahmemodus zurück."""
+        # Modus "stream": Blöcke gehen direkt an den laufenden FFmpeg-Prozess, Modus "replay": in den Replay-Puffer
+        if self.stream_writer is not None:
+            return None, self.stream_writer.write_audio
+        if self.replay is not None:
+            return None, self.replay.write_audio
+        if self.session_dir is not None:
+            audio_file = AudioFileWriter(os.path.join(self.session_dir, "audio_{index:05d}.wav"), samplerate, channels,
+                                         AUDIO_SUBTYPE, segment_seconds=SEGMENT_SECONDS)
+        else:
+            audio_file = AudioFileWriter(self.audio_path, samplerate, channels, AUDIO_SUBTYPE)
+        return audio_file, audio_file.write
+
+    def _set_audio_start(self, start_time):
+        self.audio_start_time = start_time
+        if self.stream_writer is not None:
+            self.stream_writer.set_audio_start(start_time)
+        if self._segment_writer is not None:
+            self._segment_writer.audio_start = start_time
+        if self.session_dir is not None:
+            update_session_meta(self.session_dir, audio_start=start_time)
+
+    def _report_audio(self, audio_file):
+        if self.stream_writer is not None:
+            print("\nAudioaufnahme beendet (live an FFmpeg übergeben).")
+        elif self.replay is not None:
+            print("\nAudioaufnahme beendet (im Replay-Puffer).")
+        elif audio_file is not None and audio_file.frames_written:
+            print(f"\nAudio unter {self.session_dir or self.audio_path} gespeichert.")
+        else:
+            print("\nKein Audio aufgenommen.")
+
+    def _open_video_output(self):
+        """Gibt (Writer, Zeitstempel-Protokoll oder None) für den Aufnahmemodus zurück."""
+        width, height = self.frame_size
+        timestamps = None
+        if self.stream_writer is not None:
+            # Modus "stream": Frames gehen direkt an den bereits gestarteten FFmpeg-Prozess
+            video_out = self.stream_writer
+        elif self.replay is not None:
+            # Modus "replay": JPEG-Frames im Speicher, auf Platte erst bei save_clip()
+            video_out = self.replay
+        elif self.session_dir is not None:
+            # Modus "segmented": rollierende Abschnitte mit laufend geschriebenem Zeitstempel-Protokoll
+            video_out = self._segment_writer = SegmentedAviWriter(self.session_dir, width, height, self.fps,
+                                                                  self.sync_mode, SEGMENT_SECONDS)
+            video_out.audio_start = self.audio_start_time
+        else:
+            video_out = AviWriter(self.video_path, width, height, self.fps, self.sync_mode)
+            # Die Zeitstempel gehen laufend in eine Binärdatei statt in eine wachsende Liste
+            timestamps = self._timestamps = TimestampLog(self.timestamp_path, self.fps, self.sync_mode)
+        return video_out, timestamps
+
+    def _close_video_output(self, video_out, pipeline, timestamps):
+        """Wartet auf die Pipeline, schließt den Writer und gibt die Auswertung aus."""
+        width, height = self.frame_size
+        region = self.region
+        pipeline.finish()
+        pipeline.report()
+        if pipeline.frames_written > 1 and pipeline.last_timestamp > pipeline.first_timestamp:
+            achieved_fps = (pipeline.frames_written - 1) / (pipeline.last_timestamp - pipeline.first_timestamp)
+            print(f"Erreichte Bildrate bei {width}x{height} (Aufnahme {region['width']}x{region['height']}): "
+                  f"{achieved_fps:.2f} von {self.fps} FPS")
+        closed = video_out.close()
+        if self.stream_writer is not None:
+            # Die fertige MP4 schreibt FFmpeg selbst, Zeitstempel werden nicht mehr benötigt
+            self._stream_ok = bool(closed)
+            return
+        if self.session_dir is not None:
+            print(f"Videoabschnitte und Zeitstempel-Protokolle unter {self.session_dir} gespeichert.")
+            return
+        if self.replay is not None:
+            self.replay.report()
+            return
+        print(f"Video unter {self.video_path} gespeichert.")
+        # Abgeschlossen wird das Protokoll in stop(), wenn auch die Audiodatei geschlossen ist
+        timestamps.flush()
+
+
+class MultiRegionRecorder:
+    """
+    Nimmt mehrere Bildschirmbereiche gleichzeitig in getrennte Ausgabedateien auf (z.B. Terminal und Browser).
+    Je Takt wird jeder Monitor bzw. die umschließende Box aller Bereiche nur einmal aufgenommen, Konvertierung
+    und Kodierung laufen je Bereich in einer eigenen Pipeline (siehe ScreenCapture). Das System-Audio wird
+    einmal aufgenommen und jeder Ausgabe beigelegt.
+
+        recorder = MultiRegionRecorder([terminal, browser], ["terminal.mp4", "browser.mp4"])
+        recorder.start()
+        time.sleep(10)
+        recorder.stop()
+        recorder.finalize()
+    """
+
+    def __init__(self, regions, output_paths=None, fps=FPS, mode=RECORDING_MODE, sync_mode=SYNC_MODE, timings=None,
+                 output_size=OUTPUT_SIZE, telemetry_format=TELEMETRY_FORMAT, grouping=CAPTURE_GROUPING):
+        if output_paths is not None and len(output_paths) != len(regions):
+            raise ValueError(f"{len(regions)} Bereiche, aber {len(output_paths)} Ausgabedateien")
+        if grouping not in CAPTURE_GROUPINGS:
+            raise ValueError(f"Unbekannte Gruppierung: {grouping}")
+        self.mode = mode
+        self.fps = fps
+        self.grouping = grouping
+        self.stop_event = threading.Event()
+        # Die adaptive Regelung bewertet eine einzelne Pipeline, bei gemeinsamem Takt bleibt sie ausgeschaltet
+        self.recorders = [Recorder(region, output_paths[index] if output_paths else None, fps, mode, sync_mode, timings,
+                                   output_size, adaptive=False, telemetry_format=telemetry_format)
+                          for index, region in enumerate(regions)]
+        for recorder in self.recorders:
+            recorder.stop_event = self.stop_event
+        self._capture = None
+
+    def start(self):
+        for recorder in self.recorders:
+            recorder._open_outputs()
+        self._capture = ScreenCapture(self.recorders, self.fps, self.stop_event, grouping=self.grouping)
+        self._capture.start()
+
+    def request_stop(self):
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        return self.stop_event.wait(timeout)
+
+    def stop(self):
+        self.stop_event.set()
+        if self._capture is not None:
+            self._capture.join()
+        for recorder in self.recorders:
+            recorder._close_outputs()
+
+    def finalize(self):
+        """Erstellt alle Ausgabedateien. Gibt je Bereich den Ausgabepfad oder None bei Fehler zurück."""
+        return [recorder.finalize() for recorder in self.recorders]
+
+    def save_clip(self):
+        """Speichert im Modus "replay" je Bereich einen Clip."""
+        return [recorder.save_clip() for recorder in self.recorders]
+
+
+def group_regions(regions, monitors=()):
+    """
+    Teilt die Aufnahmebereiche in Gruppen, die mit einem gemeinsamen Screenshot aufgenommen werden:
+    je Monitor die umschließende Box der vollständig darauf liegenden Bereiche, alle übrigen zusammen
+    in einer Box. Ohne Monitore entsteht eine einzige Gruppe.
+    Gibt [(box, [(index, ausschnitt), ...]), ...] zurück; ausschnitt ist (x, y, Breite, Höhe) relativ
+    zur Box oder None, wenn der Bereich die ganze Box ausfüllt.
+    """
+    def contains(outer, inner):
+        return (outer["left"] <= inner["left"] and outer["top"] <= inner["top"]
+                and inner["left"] + inner["width"] <= outer["left"] + outer["width"]
+                and inner["top"] + inner["height"] <= outer["top"] + outer["height"])
+
+    buckets = {}
+    for index, region in enumerate(regions):
+        monitor = next((number for number, monitor in enumerate(monitors) if contains(monitor, region)), None)
+        buckets.setdefault(monitor, []).append(index)
+
+    groups = []
+    for indices in buckets.values():
+        left = min(regions[index]["left"] for index in indices)
+        top = min(regions[index]["top"] for index in indices)
+        right = max(regions[index]["left"] + regions[index]["width"] for index in indices)
+        bottom = max(regions[index]["top"] + regions[index]["height"] for index in indices)
+        box = {"left": left, "top": top, "width": right - left, "height": bottom - top}
+        members = []
+        for index in indices:
+            region = regions[index]
+            if region == box:
+                members.append((index, None))
+            else:
+                members.append((index, (region["left"] - left, region["top"] - top, region["width"], region["height"])))
+        groups.append((box, members))
+    return groups
+
+
+class ScreenCapture:
+    """
+    Video- und Audio-Thread für eine oder mehrere Aufnahmen mit gemeinsamem Takt.
+    Je Takt wird jede Gruppe aus group_regions mit einem einzigen Screenshot aufgenommen; die Bereiche
+    werden daraus als NumPy-Ansichten ohne Kopie ausgeschnitten und an die Pipelines der Aufnahmen
+    übergeben, die alle denselben Zeitstempel erhalten. Der Aufwand wächst so mit den kodierten Pixeln
+    und nicht mit der Anzahl der Bereiche.
+    """
+
+    def __init__(self, recorders, fps, stop_event, adaptive=False, grouping=CAPTURE_GROUPING):
+        self.recorders = recorders
+        self.fps = fps
+        self.stop_event = stop_event
+        self.adaptive = adaptive
+        self.grouping = grouping
+        self.controller = None # AdaptiveController, solange bzw. nachdem der Video-Thread läuft
+        # Video- und Audio-Thread starten gemeinsam (2 Teilnehmer)
+        self._start_barrier = threading.Barrier(2)
+        self._threads = [threading.Thread(target=self._record_audio, name="audio"),
+                         threading.Thread(target=self._record_video, name="video")]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _record_audio(self):
+        """Nimmt System-Audio über WASAPI Loopback auf (ersetzt sounddevice-Logik)."""
+        # Warten auf das Startsignal des Video-Threads, um Synchronisation zu gewährleisten
+        self._start_barrier.wait()
+        outputs = [] # (Audiodatei oder None, Ziel der Audioblöcke) je Aufnahme
+        ring = None
+        consumer = None
+
+        try:
+            # Standard-Ausgabegerät und passendes Loopback-Mikrofon (gemerkt für weitere Aufnahmen, siehe AudioDevices.py)
+            speaker_name, source_device = AudioDevices.loopback_device()
+
+            if source_device is None:
+                print(f"FEHLER: Loopback-Gerät für '{speaker_name}' konnte nicht gefunden werden.", file=sys.stderr)
+                print("Überprüfen Sie, ob 'Stereo Mix' oder eine virtuelle Loopback-Quelle aktiviert ist.", file=sys.stderr)
+                self.stop_event.set()
+                return
+
+            print(f"Verwende Loopback-Gerät: '{source_device.name}'. Aufnahme gestartet.")
+
+            # Stream öffnen und Daten in Blöcken aufnehmen
+            samplerate = SAMPLERATE
+            channels = CHANNELS
+            outputs = [recorder._open_audio_output(samplerate, channels) for recorder in self.recorders]
+
+            # Blockgröße für die Aufnahme: (Bsp. 20ms)
+            blocksize = int(samplerate * (BLOCKSIZE_MS / 1000.0))
+
+            # Die Aufnahme schreibt nur in den Ringpuffer, Datei bzw. FFmpeg werden aus einem eigenen Thread bedient.
+            # Der Jitter der Audioblöcke erscheint in der Telemetrie der ersten Aufnahme.
+            ring = AudioRingBuffer(samplerate, channels, AUDIO_RING_SECONDS, AUDIO_GAP_THRESHOLD_MS, AUDIO_GAP_WINDOW_MS,
+                                   timings=self.recorders[0].telemetry)
+            audio_gauges = lambda: {
+                "av_drift_ms": ring.clock_lag() * 1000,
+                "audio_gaps": ring.gaps,
+                "audio_overruns": ring.overruns,
+                "audio_underruns": ring.underruns,
+                "audio_buffer_fill": (ring.write_position - ring.read_position) / ring.capacity,
+            }
+            for recorder in self.recorders:
+                recorder.telemetry.add_source(audio_gauges)
+            sinks = [sink for _, sink in outputs]
+
+            def write_all(data):
+                # Jede Aufnahme erhält dieselben Blöcke
+                for sink in sinks:
+                    sink(data)
+
+            consumer = AudioConsumer(ring, sinks[0] if len(sinks) == 1 else write_all, blocksize)
+            audio_started = False
+
+            with source_device.recorder(samplerate=samplerate, channels=channels, blocksize=blocksize) as mic_recorder:
+
+                while not self.stop_event.is_set():
+                    # Datenblock aus dem Stream lesen (blockiert, bis der Block gefüllt ist)
+                    data = mic_recorder.record()
+                    ring.write(data, clock())
+                    if not audio_started and ring.start_time is not None:
+                        audio_started = True
+                        for recorder in self.recorders:
+                            recorder._set_audio_start(ring.start_time)
+                    # Keine manuelle Pause hier, da mic_recorder.record() die Zeitsteuerung übernimmt
+
+        except Exception as e:
+            print(f"Fehler bei der Audioaufnahme: {e}", file=sys.stderr)
+            # Das gemerkte Gerät könnte entfernt worden sein, die nächste Aufnahme sucht neu
+            AudioDevices.invalidate_device_cache()
+            self.stop_event.set()
+        finally:
+            # Auch nach einem Fehler bleibt das bisher aufgenommene Audio erhalten
+            if consumer is not None:
+                consumer.close()
+            for audio_file, _ in outputs:
+                if audio_file is not None:
+                    audio_file.close()
+
+        if ring is not None:
+            ring.report()
+        if not outputs:
+            print("\nKein Audio aufgenommen.")
+        for recorder, (audio_file, _) in zip(self.recorders, outputs):
+            recorder._report_audio(audio_file)
+
+    def _record_video(self):
+        """Nimmt die Bildschirmbereiche aller Aufnahmen auf und speichert jeden Frame mit Zeitstempel."""
+        # Warten auf das Startsignal des Audio-Threads, um Synchronisation zu gewährleisten
+        self._start_barrier.wait()
+
+        outputs = [] # (Writer, Zeitstempel) je Aufnahme
         try:
-            screenshot = sct.grab(monitor_area)
-            frame = np.array(screenshot)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-            video_out.write(frame)
-            timestamps.append(start_time) # Zeitstempel des aufgenommenen Frames speichern
-            
+            sct = mss.mss()
+            for recorder in self.recorders:
+                outputs.append(recorder._open_video_output())
+            # Ein einzelner Bereich wird unverändert aufgenommen, sonst je Monitor bzw. über die umschließende Box
+            monitors = sct.monitors[1:] if self.grouping == "monitor" and len(self.recorders) > 1 else ()
+            groups = group_regions([recorder.region for recorder in self.recorders], monitors)
+
+            # Die Regelung misst die Laufzeiten der Stufen selbst und reicht sie an timings weiter
+            controller = AdaptiveController(self.fps, timings=self.recorders[0].telemetry) if self.adaptive else None
+            self.controller = controller
+            timings = [recorder.telemetry for recorder in self.recorders]
+            if controller is not None:
+                timings[0] = controller
+
+            # Konvertierung und Kodierung laufen je Aufnahme in eigenen Threads, dieser Thread nimmt nur auf
+            pipelines = [VideoPipeline(video_out, timestamps, QUEUE_SIZE, QUEUE_FULL_POLICY, timings=stage_timings,
+                                       detect_duplicates=DUPLICATE_DETECTION, output_size=recorder.frame_size)
+                         for recorder, (video_out, timestamps), stage_timings in zip(self.recorders, outputs, timings)]
         except Exception as e:
-            print(f"Fehler beim Frame-Grab: {e}", file=sys.stderr)
-            time.sleep(0.1)
-        
-        # FRAMERATE-KORREKTUR: Berechnet die verbleibende Zeit, um die Ziel-FPS zu treffen
-        elapsed_time = time.time() - start_time
-        sleep_time = frame_duration - elapsed_time
-        if sleep_time > 0:
-            time.sleep(sleep_time)
-            
-    print("Videoaufnahme wird beendet...")
-    if video_out:
-        video_out.release()
-    cv2.destroyAllWindows()
-    print(f"Video unter {VIDEO_FILENAME} gespeichert.")
-    
-    # Zeitstempel speichern, nachdem die Aufnahme beendet ist
-    try:
-        with open(TIMESTAMP_FILENAME, 'w') as f:
-            json.dump(timestamps, f)
-        print(f"Zeitstempel unter {TIMESTAMP_FILENAME} gespeichert.")
-    except Exception as e:
-        print(f"FEHLER beim Speichern der Zeitstempel: {e}", file=sys.stderr)
+            # Ohne Video ist die Aufnahme wertlos: auch den Audio-Thread beenden, statt nur Ton aufzunehmen
+            print(f"FEHLER beim Start der Videoaufnahme: {e}", file=sys.stderr)
+            self.stop_event.set()
+            for video_out, _ in outputs:
+                try:
+                    video_out.close()
+                except Exception as close_error:
+                    print(f"Fehler beim Schließen der Videoausgabe: {close_error}", file=sys.stderr)
+            return
+
+        print("Videoaufnahme gestartet.")
+        if len(self.recorders) > 1:
+            for box, members in groups:
+                print(f"Gemeinsamer Screenshot {box['width']}x{box['height']} an ({box['left']}, {box['top']}) "
+                      f"für {len(members)} Bereich(e)")
+        for pipeline in pipelines:
+            pipeline.start()
+
+        # FRAMERATE-KORREKTUR: Absolute Termine auf der monotonen Uhr statt relativer Pausen
+        scheduler = FrameScheduler(self.fps, MISSED_FRAME_POLICY, SCHEDULER_SPIN_MS)
+        for recorder, pipeline in zip(self.recorders, pipelines):
+            recorder.telemetry.add_source(lambda pipeline=pipeline: {
+                "capture_fps": scheduler.fps,
+                "frames_captured": pipeline.frames_captured,
+                "frames_written": pipeline.frames_written,
+                "frames_unchanged": pipeline.frames_unchanged,
+                "queue_depth_convert": pipeline.convert_queue.qsize(),
+                "queue_depth_encode": pipeline.encode_queue.qsize(),
+                "queue_max_depth_convert": pipeline.convert_queue.max_depth,
+                "queue_max_depth_encode": pipeline.encode_queue.max_depth,
+                "dropped_frames_convert": pipeline.convert_queue.dropped,
+                "dropped_frames_encode": pipeline.encode_queue.dropped,
+                "missed_deadlines": scheduler.missed,
+            })
+
+        while not self.stop_event.is_set():
+            start_time = scheduler.wait_next()
+            # Bei nachgeholten Frames liegt der Zeitstempel in der Vergangenheit, die Dauer wird daher eigens gemessen
+            grab_start = clock()
+
+            try:
+                for box, members in groups:
+                    screenshot = sct.grab(box)
+                    grab_time = clock() - grab_start
+                    pixels = None
+                    for index, area in members:
+                        timings[index].record("grab", grab_time)
+                        if area is None:
+                            pipelines[index].submit(start_time, screenshot)
+                            continue
+                        # Ausschnitt als Ansicht auf den Puffer des gemeinsamen Screenshots, ohne Kopie
+                        if pixels is None:
+                            pixels = screenshot_as_array(screenshot)
+                        x, y, width, height = area
+                        pipelines[index].submit(start_time, pixels[y:y + height, x:x + width])
+                if controller is not None:
+                    new_fps = controller.update(clock(), pipelines[0], scheduler)
+                    if new_fps is not None:
+                        scheduler.change_fps(new_fps)
+
+            except Exception as e:
+                print(f"Fehler beim Frame-Grab: {e}", file=sys.stderr)
+                time.sleep(0.1)
+
+        print("Videoaufnahme wird beendet...")
+        scheduler.report()
+        if controller is not None:
+            controller.report()
+        for recorder, (video_out, timestamps), pipeline in zip(self.recorders, outputs, pipelines):
+            recorder._close_video_output(video_out, pipeline, timestamps)
 
 
 # --- GUI FUNKTIONEN ---
 
 def start_threads_and_gui_switch():
-    """Startet die Aufnahme-Threads und wechselt die GUI."""
-    global monitor_area
+    """Startet die Aufnahme und wechselt die GUI."""
+    global gui_recorder
     
     # Erfassen der endgültigen Fenstergeometrie
     geom = root_window.winfo_geometry()
@@ -271,7 +2611,7 @@ def start_threads_and_gui_switch():
     x = int(parts[1].split('+')[1])
     y = int(parts[1].split('+')[2])
     
-    monitor_area = {"top": y, "left": x, "width": width, "height": height}
+    gui_recorder = Recorder({"top": y, "left": x, "width": width, "height": height}, **gui_recorder_options)
     
     # GUI-Fenster auf den Aufnahmemodus umschalten
     root_window.geometry("150x50+50+50")
@@ -286,51 +2626,46 @@ def start_threads_and_gui_switch():
     stop_button = tk.Button(root_window, text="Stop Aufnahme", command=stop_recording_and_cleanup)
     stop_button.pack(fill=tk.BOTH, expand=True)
 
-    # Threads starten
-    audio_thread = threading.Thread(target=record_audio)
-    video_thread = threading.Thread(target=record_video)
-    
-    audio_thread.start()
-    video_thread.start()
-    # Warten auf die Threads wird jetzt von start_barrier.wait() übernommen.
+    if gui_recorder.mode == "replay":
+        # Der Clip wird im Hintergrund geschrieben, das Fenster bleibt bedienbar
+        root_window.geometry("150x90+50+50")
+        clip_button = tk.Button(root_window, text="Clip speichern",
+                                command=lambda: threading.Thread(target=gui_recorder.save_clip, name="save-clip").start())
+        clip_button.pack(fill=tk.BOTH, expand=True)
+
+    # Threads starten, der gemeinsame Start erfolgt über die Barrier im Recorder
+    gui_recorder.start()
 
 def stop_recording_and_cleanup():
     """Beendet die Aufnahme und schließt das Fenster."""
-    stop_recording.set()
+    gui_recorder.request_stop()
     # Da die Threads noch kurz brauchen, um ihre Schleifen zu verlassen, 
     # warten wir kurz, bevor wir das Fenster zerstören.
     root_window.after(500, root_window.destroy) 
 
-def get_next_available_filename(base_filename):
+def reserve_output_filename(base_filename):
     """
-    Generiert einen eindeutigen Dateinamen im Format 'name_x.mp4'.
-    Wenn 'output.mp4' existiert, wird 'output_1.mp4' geprüft, dann 'output_2.mp4', usw.
-
-    :param base_filename: Der ursprüngliche Dateiname (z.B. "output.mp4").
-    :return: Der erste nicht existierende Dateiname.
+    Gibt den ersten freien Namen im Format 'name_x.mp4' zurück (output.mp4, output_1.mp4, ...) und legt ihn
+    sofort als leere Platzhalterdatei an (O_CREAT | O_EXCL). Auch wenn mehrere Aufnahmen oder Prozesse
+    gleichzeitig einen Namen suchen, erhält so jede einen eigenen. Die fertige Datei ersetzt den Platzhalter später.
     """
-    # 1. Initialprüfung
-    if not os.path.exists(base_filename):
-        # Die Originaldatei existiert nicht, wir können sie verwenden.
-        return base_filename
-
-    # 2. Basisname und Erweiterung extrahieren
-    # z.B. aus "output.mp4" wird name="output", ext=".mp4"
     name, ext = os.path.splitext(base_filename)
-    counter = 1
-
-    # 3. Schleife, um den nächsten freien Zähler zu finden
+    counter = 0
     while True:
-        # Generiere den potenziellen nächsten Dateinamen: "output_1.mp4", "output_2.mp4", ...
-        new_filename = f"{name}_{counter}{ext}"
+        candidate = f"{name}_{counter}{ext}" if counter else base_filename
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return candidate
+        except FileExistsError:
+            counter += 1
 
-        # Prüfe, ob die generierte Datei existiert
-        if not os.path.exists(new_filename):
-            # Der Name existiert nicht, gib ihn zurück. Die Schleife wird beendet.
-            return new_filename
-        
-        # Die Datei existiert, erhöhe den Zähler und prüfe im nächsten Schleifendurchlauf.
-        counter += 1
+def release_output_filename(path):
+    """Entfernt den Platzhalter von reserve_output_filename, falls keine Ausgabe entstanden ist."""
+    try:
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+    except OSError:
+        pass
 
 
 def create_gui():
@@ -392,13 +2727,127 @@ def create_gui():
 
     root_window.mainloop()
 
-if __name__ == "__main__":
-    print("Erstelle GUI zur Auswahl des Aufnahmebereichs...")
-    create_gui()
-  
-    OUTPUT_FILENAME = get_next_available_filename(OUTPUT_FILENAME)
+# --- KOMMANDOZEILE ---
+
+def parse_region(text):
+    """Wandelt 'X,Y,BREITE,HÖHE' in einen Aufnahmebereich für mss um."""
+    try:
+        left, top, width, height = (int(part) for part in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Bereich muss als X,Y,BREITE,HÖHE angegeben werden, nicht '{text}'")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("Breite und Höhe müssen größer als 0 sein")
+    return {"left": left, "top": top, "width": width, "height": height}
+
+def parse_crop(text):
+    """Wie parse_region, aber als (x, y, Breite, Höhe) für den Parameter crop des Recorders."""
+    region = parse_region(text)
+    return region["left"], region["top"], region["width"], region["height"]
+
+def parse_size(text):
+    """Wandelt 'BREITExHÖHE' in (Breite, Höhe) um."""
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Größe muss als BREITExHÖHE angegeben werden, nicht '{text}'")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("Breite und Höhe müssen größer als 0 sein")
+    return width, height
+
+def start_background_mux_queue(directory):
+    """Startet MuxQueue.py als eigenständigen Prozess, der auch nach dem Ende dieses Programms weiterläuft."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MuxQueue.py")
+    log_path = os.path.join(directory, "muxqueue.log")
+    # Eigene Prozessgruppe, damit ein Strg+C in diesem Fenster die Kodierung nicht abbricht
+    options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+    with open(log_path, "a") as log:
+        subprocess.Popen([sys.executable, script, directory], stdin=subprocess.DEVNULL, stdout=log,
+                         stderr=subprocess.STDOUT, **options)
+    print(f"Aufnahme abgelegt. Das Zusammenführen läuft im Hintergrund (Protokoll: {log_path}).")
+
+def save_clips_on_enter(recorder):
+    """Speichert im Modus "replay" bei jeder Eingabezeile einen Clip (Kommandozeile ohne GUI)."""
+    for _ in sys.stdin:
+        if recorder.stop_event.is_set():
+            return
+        recorder.save_clip()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bildschirmaufnahme mit System-Audio. "
+                                                 "Ohne --region wird der Bereich über die GUI gewählt.")
+    parser.add_argument("--region", type=parse_region, action="append",
+                        help="Aufnahmebereich als X,Y,BREITE,HÖHE (ohne GUI); mehrfach angegeben entsteht je Bereich eine Ausgabe")
+    parser.add_argument("--fps", type=int, default=FPS, help=f"Bildrate (Standard: {FPS})")
+    parser.add_argument("--duration", type=float, help="Aufnahmedauer in Sekunden (Standard: bis Strg+C)")
+    parser.add_argument("--output", action="append",
+                        help=f"Ausgabedatei, je Bereich einmal (Standard: nächster freier Name ab {OUTPUT_FILENAME})")
+    parser.add_argument("--scale", type=parse_size, default=OUTPUT_SIZE,
+                        help="Ausgabegröße als BREITExHÖHE, z.B. 1280x720 (Standard: Größe des Bereichs)")
+    parser.add_argument("--crop", type=parse_crop, help="Ausschnitt X,Y,BREITE,HÖHE relativ zum Aufnahmebereich")
+    parser.add_argument("--telemetry", choices=("jsonl", "prometheus"), default=TELEMETRY_FORMAT,
+                        help="Messwerte periodisch als JSON-Zeilen oder Prometheus-Textdatei neben die Ausgabe schreiben")
+    parser.add_argument("--grouping", choices=CAPTURE_GROUPINGS, default=CAPTURE_GROUPING,
+                        help="Gemeinsamer Screenshot mehrerer Bereiche je Monitor oder über alle Bereiche")
+    parser.add_argument("--mode", choices=RECORDING_MODES, default=RECORDING_MODE, help="Aufnahmemodus")
+    parser.add_argument("--defer", action="store_true", default=DEFER_FINALIZE,
+                        help="Nicht selbst zusammenführen, sondern MuxQueue.py im Hintergrund starten")
+    parser.add_argument("--finalize", metavar="SITZUNG",
+                        help="Sitzungsverzeichnis (z.B. nach einem Absturz) zusammenführen und beenden")
+    args = parser.parse_args(argv)
+    regions = args.region or [None]
+    if args.output and len(args.output) != len(regions):
+        parser.error("--output muss für jeden Bereich genau einmal angegeben werden")
+    outputs = args.output or [None] * len(regions)
+    if args.crop and len(regions) > 1:
+        parser.error("--crop ist nur mit einem Bereich möglich")
+
+    if args.finalize:
+        output = outputs[0] or reserve_output_filename(OUTPUT_FILENAME)
+        return 0 if finalize_session(args.finalize, output) else 1
+
+    if args.region is None:
+        print("Erstelle GUI zur Auswahl des Aufnahmebereichs...")
+        gui_recorder_options.update(output_path=outputs[0], fps=args.fps, mode=args.mode,
+                                    output_size=args.scale, crop=args.crop, telemetry_format=args.telemetry)
+        create_gui()
+        if gui_recorder is None:
+            print("Keine Aufnahme gestartet.")
+            return 0
+        recorder = gui_recorder
+    else:
+        if len(regions) > 1:
+            # Ein Screenshot je Takt für alle Bereiche, je Bereich eine eigene Pipeline und Ausgabedatei
+            recorder = MultiRegionRecorder(regions, args.output, args.fps, args.mode, output_size=args.scale,
+                                           telemetry_format=args.telemetry, grouping=args.grouping)
+        else:
+            recorder = Recorder(regions[0], outputs[0], args.fps, args.mode, output_size=args.scale,
+                                crop=args.crop, telemetry_format=args.telemetry)
+        recorder.start()
+        print("Aufnahme läuft " + (f"für {args.duration:g} s..." if args.duration else "bis Strg+C..."))
+        if recorder.mode == "replay":
+            print(f"Eingabetaste speichert die letzten {REPLAY_SECONDS} s als Clip.")
+            threading.Thread(target=save_clips_on_enter, args=(recorder,), name="replay-input", daemon=True).start()
+        deadline = clock() + args.duration if args.duration else None
+        try:
+            # Kurze Wartezeiten, damit Strg+C auch unter Windows sofort ankommt
+            while not recorder.wait(0.5):
+                if deadline is not None and clock() >= deadline:
+                    break
+        except KeyboardInterrupt:
+            print("\nAbbruch durch Benutzer, Aufnahme wird beendet...")
+
+    # Erst weitermachen, wenn Video- und Audio-Thread ihre Dateien bzw. die Live-Kodierung abgeschlossen haben
+    recorder.stop()
+    recorders = recorder.recorders if isinstance(recorder, MultiRegionRecorder) else [recorder]
+    if args.defer and recorder.mode in ("avi", "segmented"):
+        directories = {os.path.dirname(os.path.abspath(item.session_dir or item.output_path)) for item in recorders}
+        for directory in sorted(directories):
+            start_background_mux_queue(directory)
+        return 0
+    outputs = [item.finalize() for item in recorders]
 
-    # Automatisches Muxing mit FFmpeg
-    mux_files_with_ffmpeg(VIDEO_FILENAME, AUDIO_FILENAME, OUTPUT_FILENAME, TIMESTAMP_FILENAME)
-    
     print("\nAlle Vorgänge abgeschlossen.")
+    return 0 if all(outputs) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())